@@ -0,0 +1,193 @@
+import csv
+import sys
+from collections import namedtuple
+
+import numpy as np
+
+import signals
+
+BAR_FIELDS = ["open_price", "close_price", "high_price", "low_price"]
+# number of daily bars covered by each historicals span
+SPAN_DAYS = {"day": 1, "week": 5, "month": 21,
+             "3month": 63, "year": 252, "5year": 1260}
+
+# prices maps each of BAR_FIELDS to a bars x symbols array, with NaN where a symbol has no bar
+Bars = namedtuple("Bars", ["dates", "symbols", "prices"])
+Trade = namedtuple("Trade", ["date", "symbol", "side", "shares", "price"])
+BacktestResult = namedtuple(
+    "BacktestResult", ["dates", "values", "trades", "summary"])
+
+
+def load_bars(path):
+    # reads bars with the same columns robin_stocks historicals have: begins_at, symbol and BAR_FIELDS
+    if path.endswith(".parquet"):
+        import pandas as pd
+        frame = pd.read_parquet(path)
+        return build_bars(frame["begins_at"].astype(str).to_numpy(), frame["symbol"].to_numpy(),
+                          frame[BAR_FIELDS].to_numpy(dtype=float))
+    with open(path, newline="") as bar_file:
+        rows = [(row["begins_at"], row["symbol"], [row[field] for field in BAR_FIELDS])
+                for row in csv.DictReader(bar_file)]
+    return build_bars([row[0] for row in rows], [row[1] for row in rows],
+                      np.array([row[2] for row in rows], dtype=float).reshape(-1, len(BAR_FIELDS)))
+
+
+def build_bars(dates, symbols, values):
+    unique_dates, date_index = np.unique(
+        np.asarray(dates, dtype=str), return_inverse=True)
+    unique_symbols, symbol_index = np.unique(
+        np.asarray(symbols, dtype=str), return_inverse=True)
+    prices = {}
+    for column, field in enumerate(BAR_FIELDS):
+        prices[field] = np.full(
+            (len(unique_dates), len(unique_symbols)), np.nan)
+        prices[field][date_index, symbol_index] = values[:, column]
+    return Bars(unique_dates, list(unique_symbols), prices)
+
+
+def forward_fill(values):
+    rows = np.where(~np.isnan(values), np.arange(
+        values.shape[0])[:, None], 0)
+    rows = np.maximum.accumulate(rows, axis=0)
+    return values[rows, np.arange(values.shape[1])]
+
+
+class Backtest:
+    # Replays daily bars through the buy_from_top_stocks and sell_portfolio rules, treating every symbol in the
+    # bars as a top stock. Signals are computed for all bars and symbols up front; only the cash and position
+    # bookkeeping steps through the bars.
+    def __init__(self, bars, initial_cash=10000, **kwargs):
+        self.bars = bars
+        self.initial_cash = initial_cash
+        self.avoid_year_threshold = kwargs.get("avoid_year_threshold")
+        self.buy_dollar_limit = kwargs.get("buy_dollar_limit")
+        self.buy_limit = kwargs.get("buy_limit")
+        self.buy_threshold = kwargs.get("buy_threshold")
+        self.buy_year_threshold = kwargs.get("buy_year_threshold")
+        self.buying_power_limit = kwargs.get("buying_power_limit")
+        self.data_point = kwargs.get("data_point")
+        self.portfolio_buy_threshold = kwargs.get("portfolio_buy_threshold")
+        self.portfolio_sell_threshold = kwargs.get("portfolio_sell_threshold")
+        self.profit_threshold = kwargs.get("profit_threshold")
+        self.sell_dollar_limit = kwargs.get("sell_dollar_limit")
+        self.sell_fractional = kwargs.get("sell_fractional")
+        self.sell_limit = kwargs.get("sell_limit")
+        self.sell_year_threshold = kwargs.get("sell_year_threshold")
+        self.span_bars = kwargs.get("span_bars") or SPAN_DAYS[kwargs.get("span")]
+        self.year_bars = kwargs.get("year_bars", 252)
+
+    def compute_indicators(self):
+        close = self.bars.prices["close_price"]
+        first_prices = np.full_like(close, np.nan)
+        first_prices[self.span_bars:] = self.bars.prices[self.data_point][:-self.span_bars]
+        price_change = signals.price_changes(close, first_prices)
+        year_high = signals.rolling_max(
+            self.bars.prices["high_price"], self.year_bars)
+        price_ratio = signals.price_ratios(close, year_high)
+        return price_change, price_ratio
+
+    def compute_signals(self, indicators=None):
+        # indicators only depend on span_bars, data_point and year_bars, so they can be shared between configs
+        price_change, price_ratio = indicators or self.compute_indicators()
+        buy = signals.buy_mask(price_change, price_ratio, self.buy_threshold,
+                               self.avoid_year_threshold, self.buy_year_threshold)
+        return price_change, price_ratio, buy
+
+    def get_sell_shares(self, shares, price, total_in_robinhood):
+        # same sizing as RobinBot.sell_within_limits
+        equity = shares * price
+        if equity == 0 or self.sell_fractional is False:
+            return shares
+        sell_amount = equity
+        if sell_amount / total_in_robinhood > self.portfolio_sell_threshold:
+            sell_amount = self.portfolio_sell_threshold * total_in_robinhood
+        if sell_amount < self.sell_dollar_limit:
+            return min(sell_amount / price, shares)
+        if abs(equity - sell_amount) < self.sell_dollar_limit:
+            return shares
+        return sell_amount / price
+
+    def get_buy_amount(self, buying_power, total_in_robinhood):
+        # same sizing as RobinBot.buy_within_limits
+        buy_amount = buying_power * self.buying_power_limit
+        if buy_amount / total_in_robinhood > self.portfolio_buy_threshold:
+            buy_amount = self.portfolio_buy_threshold * total_in_robinhood
+        if buy_amount / buying_power > self.buying_power_limit:
+            buy_amount = buying_power * self.buying_power_limit
+        if buy_amount < self.buy_dollar_limit:
+            buy_amount = self.buy_dollar_limit
+        return min(buy_amount, buying_power)
+
+    def run(self, indicators=None):
+        price_change, price_ratio, buy = self.compute_signals(indicators)
+        close = self.bars.prices["close_price"]
+        valuation_prices = forward_fill(close)
+        dates, symbols = self.bars.dates, self.bars.symbols
+
+        cash = float(self.initial_cash)
+        shares = np.zeros(len(symbols))
+        cost_basis = np.zeros(len(symbols))
+        values = np.empty(len(dates))
+        trades = []
+
+        for t in range(len(dates)):
+            prices = close[t]
+            tradable = ~np.isnan(prices)
+
+            # sell_portfolio only evaluates the first sell_limit positions
+            held = np.flatnonzero(shares > 0)[:self.sell_limit]
+            held = held[tradable[held]]
+            average_cost = cost_basis[held] / shares[held]
+            profit = (prices[held] - average_cost) / average_cost
+            selling = held[signals.sell_mask(profit, price_ratio[t, held],
+                                             self.profit_threshold, self.sell_year_threshold)]
+            # same formula as RobinBot.get_total_in_robinhood
+            total_in_robinhood = cash + cash + \
+                np.nansum(shares * valuation_prices[t])
+            for i in selling:
+                sell_shares = min(self.get_sell_shares(
+                    shares[i], prices[i], total_in_robinhood), shares[i])
+                cost_basis[i] -= cost_basis[i] * sell_shares / shares[i]
+                shares[i] -= sell_shares
+                cash += sell_shares * prices[i]
+                trades.append(
+                    Trade(dates[t], symbols[i], "sell", sell_shares, prices[i]))
+
+            # buy_from_top_stocks ranks falling stocks outside the portfolio, then checks the first buy_limit of them
+            candidates = np.flatnonzero(
+                tradable & (price_change[t] < 0) & (shares == 0))
+            candidates = candidates[np.argsort(
+                -price_change[t, candidates], kind="stable")][:self.buy_limit]
+            total_in_robinhood = cash + cash + \
+                np.nansum(shares * valuation_prices[t])
+            for i in candidates[buy[t, candidates]]:
+                if cash < self.buy_dollar_limit:
+                    break
+                buy_amount = self.get_buy_amount(cash, total_in_robinhood)
+                shares[i] += buy_amount / prices[i]
+                cost_basis[i] += buy_amount
+                cash -= buy_amount
+                trades.append(
+                    Trade(dates[t], symbols[i], "buy", buy_amount / prices[i], prices[i]))
+
+            values[t] = cash + np.nansum(shares * valuation_prices[t])
+
+        return BacktestResult(dates, values, trades, self.summarize(values, trades))
+
+    def summarize(self, values, trades):
+        peaks = np.maximum.accumulate(values)
+        return {
+            "initial_value": float(self.initial_cash),
+            "final_value": float(values[-1]),
+            "profit": float(values[-1] - self.initial_cash),
+            "total_return": float(values[-1] / self.initial_cash - 1),
+            "max_drawdown": float(np.max(1 - values / peaks)),
+            "trades": len(trades),
+        }
+
+
+if __name__ == "__main__":
+    import example_config
+    result = Backtest(load_bars(sys.argv[1]), **example_config.config).run()
+    for key, value in result.summary.items():
+        print(f"{key}: {value}")
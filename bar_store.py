@@ -0,0 +1,118 @@
+import os
+import threading
+import time
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    # without file locks, only threads of one process can update a store at once
+    fcntl = None
+
+BAR_DTYPE = np.dtype([("time", "<i8"), ("open_price", "<f8"), ("close_price", "<f8"),
+                      ("high_price", "<f8"), ("low_price", "<f8")])
+INTERVAL_SECONDS = {"15second": 15, "5minute": 300, "10minute": 600,
+                    "hour": 3600, "day": 86400, "week": 7 * 86400}
+# longest each historicals span can be, smallest first
+SPAN_SECONDS = {"day": 86400, "week": 7 * 86400, "month": 31 * 86400, "3month": 92 * 86400,
+                "year": 366 * 86400, "5year": 5 * 366 * 86400}
+# Robinhood's day span is a trading day, which starts at midnight here
+MARKET_TIMEZONE = ZoneInfo("America/New_York")
+
+
+class BarStore:
+    # Keeps historical bars on disk in one append-only file of BAR_DTYPE records per interval and symbol, so each
+    # update only downloads the bars newer than the last stored one. Only completed bars are stored. Stores can be
+    # shared by processes, e.g. a supervisor's workers, so appends lock the file.
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.Lock()
+
+    def get_path(self, symbol, interval):
+        return os.path.join(self.directory, interval, f"{symbol}.bars")
+
+    def get_bars(self, symbol, interval):
+        path = self.get_path(symbol, interval)
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return np.empty(0, dtype=BAR_DTYPE)
+        return np.memmap(path, dtype=BAR_DTYPE, mode="r")
+
+    def get_last_time(self, symbol, interval):
+        bars = self.get_bars(symbol, interval)
+        return int(bars["time"][-1]) if len(bars) else None
+
+    def append(self, symbol, interval, bars):
+        path = self.get_path(symbol, interval)
+        with self.lock:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "ab") as bar_file:
+                if fcntl is not None:
+                    fcntl.flock(bar_file, fcntl.LOCK_EX)
+                # another process may have stored some of the bars since they were fetched
+                last_time = self.get_last_time(symbol, interval)
+                if last_time is not None:
+                    bars = bars[bars["time"] > last_time]
+                bar_file.write(bars.tobytes())
+
+    def get_update_span(self, symbol, interval, span, now):
+        # the smallest span that reaches back to the last stored bar, or covers span if nothing is stored yet
+        last_time = self.get_last_time(symbol, interval)
+        needed = SPAN_SECONDS[span] if last_time is None else now - last_time
+        for update_span, seconds in SPAN_SECONDS.items():
+            if seconds > INTERVAL_SECONDS[interval] and seconds >= needed:
+                return update_span
+        return "5year"
+
+    def update(self, symbols, interval, span, fetch_bars):
+        # fetch_bars(symbols, interval, span) returns bars shaped like robin_stocks historicals. Symbols that
+        # need the same update span are fetched together.
+        now = time.time()
+        symbols_by_span = {}
+        for symbol in symbols:
+            last_time = self.get_last_time(symbol, interval)
+            if last_time is not None and now - last_time < 2 * INTERVAL_SECONDS[interval]:
+                continue
+            symbols_by_span.setdefault(self.get_update_span(
+                symbol, interval, span, now), []).append(symbol)
+
+        for update_span, span_symbols in symbols_by_span.items():
+            new_bars = {symbol: [] for symbol in span_symbols}
+            for bar in fetch_bars(span_symbols, interval, update_span) or []:
+                if bar and bar["symbol"] in new_bars:
+                    new_bars[bar["symbol"]].append(bar)
+            for symbol, bars in new_bars.items():
+                last_time = self.get_last_time(symbol, interval) or 0
+                records = [(bar_time, *(float(bar[field]) for field in BAR_DTYPE.names[1:]))
+                           for bar_time, bar in ((parse_time(bar["begins_at"]), bar) for bar in bars)
+                           if last_time < bar_time and bar_time + INTERVAL_SECONDS[interval] <= now]
+                if records:
+                    self.append(symbol, interval, np.array(
+                        records, dtype=BAR_DTYPE))
+
+    def get_bars_in_span(self, symbol, interval, span):
+        # the day span is the trading day of the last bar, as Robinhood returns it, and longer spans reach back
+        # their length from now
+        bars = self.get_bars(symbol, interval)
+        if not len(bars):
+            return bars
+        if span == "day":
+            last_day = datetime.fromtimestamp(int(bars["time"][-1]), MARKET_TIMEZONE)
+            start_time = last_day.replace(hour=0, minute=0, second=0).timestamp()
+        else:
+            start_time = time.time() - SPAN_SECONDS[span]
+        return bars[np.searchsorted(bars["time"], start_time):]
+
+    def first_price(self, symbol, interval, span, data_point):
+        bars = self.get_bars_in_span(symbol, interval, span)
+        return float(bars[data_point][0]) if len(bars) else None
+
+    def year_high(self, symbol):
+        bars = self.get_bars_in_span(symbol, "day", "year")
+        return float(bars["high_price"].max()) if len(bars) else None
+
+
+def parse_time(begins_at):
+    return int(datetime.fromisoformat(begins_at.replace("Z", "+00:00")).timestamp())
@@ -0,0 +1,134 @@
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+
+import example_config
+from broker import FakeBroker
+from robin_bot import RobinBot
+
+SIZES = [1, 10, 50, 100, 250, 500]
+
+
+class DelayedBroker:
+    # Sleeps latency seconds before every call, to stand in for the network round trip a fake broker doesn't have
+    def __init__(self, broker, latency):
+        self.broker = broker
+        self.latency = latency
+
+    def __getattr__(self, name):
+        attribute = getattr(self.broker, name)
+        if not callable(attribute):
+            return attribute
+
+        def delayed(*args, **kwargs):
+            time.sleep(self.latency)
+            return attribute(*args, **kwargs)
+        return delayed
+
+
+def get_broker(size):
+    # every other symbol is down 10% over the span and 20% under its 52-week high, and every held symbol is
+    # up 20% on its average cost, so each scenario evaluates and places a realistic mix of orders
+    symbols = [f"S{i:04d}" for i in range(size)]
+    quotes = {symbol: 100.0 for symbol in symbols}
+    historicals = {symbol: [110.0 if i % 2 else 95.0, 100.0]
+                   for i, symbol in enumerate(symbols)}
+    return FakeBroker(buying_power=10 ** 9, quotes=quotes,
+                      year_highs={symbol: 125.0 for symbol in symbols},
+                      historicals=historicals,
+                      holdings={symbol: (10, 80.0) for symbol in symbols},
+                      top_100=symbols[:100])
+
+
+def time_evaluations(bot, method_name, durations):
+    method = getattr(bot, method_name)
+
+    def timed(ticker_symbol):
+        start = time.perf_counter()
+        try:
+            return method(ticker_symbol)
+        finally:
+            durations.append(time.perf_counter() - start)
+    setattr(bot, method_name, timed)
+
+
+def time_screen(bot, durations):
+    # screening evaluates every symbol at once, so each symbol is counted as an equal share of the screen
+    method = bot.screen
+
+    def timed(ticker_list, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return method(ticker_list, *args, **kwargs)
+        finally:
+            durations.extend([(time.perf_counter() - start) /
+                             max(len(ticker_list), 1)] * len(ticker_list))
+    bot.screen = timed
+
+
+def run_scenario(name, size, latency, workers):
+    broker = get_broker(size)
+    bot = RobinBot(**{**example_config.config, "sell_limit": None, "workers": workers, "requests_per_second": None},
+                   broker=DelayedBroker(broker, latency) if latency else broker)
+    durations = []
+    time_evaluations(bot, "check_sell_conditions", durations)
+    time_evaluations(bot, "check_buy_conditions", durations)
+    time_screen(bot, durations)
+
+    start = time.perf_counter()
+    if name == "sell_portfolio":
+        bot.sell_portfolio()
+    elif name == "buy_from_top_stocks":
+        # buy from stocks outside the portfolio, so buy candidates aren't filtered out
+        broker.holdings.clear()
+        bot.buy_from_top_stocks(buy_limit=min(size, 100))
+    else:
+        bot.buy_from_ticker_list(list(broker.quotes))
+    wall_time = time.perf_counter() - start
+    stats = bot.instrumentation.dump()
+
+    return {
+        "scenario": name,
+        "size": size,
+        "workers": workers,
+        "latency": latency,
+        "wall_time": wall_time,
+        "calls": {method_name: method_stats["calls"] for method_name, method_stats in stats.items()},
+        "total_calls": sum(method_stats["calls"] for method_stats in stats.values()),
+        "call_seconds": sum(method_stats["seconds"] for method_stats in stats.values()),
+        "evaluations": len(durations),
+        "evaluation_p50": float(np.percentile(durations, 50)) if durations else None,
+        "evaluation_p99": float(np.percentile(durations, 99)) if durations else None,
+    }
+
+
+def run_benchmarks(sizes=SIZES, latency=0, workers=None):
+    results = []
+    for name in ["sell_portfolio", "buy_from_top_stocks", "buy_from_ticker_list"]:
+        for size in sizes:
+            if name == "buy_from_top_stocks" and size > 100:
+                continue
+            results.append(run_scenario(name, size, latency, workers))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Counts broker calls and times RobinBot decision cycles against a fake broker.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--latency", type=float, default=0,
+                        help="seconds of simulated latency per broker call")
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--output", help="JSON file to write results to")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.sizes, args.latency, args.workers)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+    for result in results:
+        print(f"{result['scenario']:<22}{result['size']:>5} symbols  {result['total_calls']:>5} calls  "
+              f"{result['wall_time']:.4f}s", file=sys.stderr)
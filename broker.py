@@ -0,0 +1,286 @@
+import itertools
+import os
+import time
+from datetime import datetime, timezone
+
+
+class RobinhoodBroker:
+    # The robin_stocks calls RobinBot and RobinCryptoBot make. Any object with these methods can be passed to
+    # a bot as its broker, e.g. FakeBroker for offline runs. Credentials are read from the <env_prefix>_USERNAME,
+    # <env_prefix>_PASSWORD and <env_prefix>_AUTH environment variables.
+    def __init__(self, env_prefix="ROBINHOOD"):
+        import robin_stocks.robinhood as rs
+        self.rs = rs
+        self.env_prefix = env_prefix
+        # other accounts' stored sessions are kept in their own files
+        self.pickle_name = "" if env_prefix == "ROBINHOOD" else env_prefix
+        self.crypto_pair_ids = {}
+
+    def get_session_path(self):
+        # where robin_stocks stores the session when logging in with store_session
+        return os.path.join(os.path.expanduser("~"), ".tokens", f"robinhood{self.pickle_name}.pickle")
+
+    def stored_session_time(self):
+        # when the stored session was issued, or None if there isn't one
+        path = self.get_session_path()
+        return os.path.getmtime(path) if os.path.isfile(path) else None
+
+    def login(self, store_session=False, expires_in=86400, force=False):
+        # robin_stocks returns a stored session unchanged while it's still valid, so force removes it first to
+        # get a new one
+        if force and os.path.isfile(self.get_session_path()):
+            os.remove(self.get_session_path())
+        import pyotp
+        from dotenv import load_dotenv
+        load_dotenv()
+        robin_user = os.environ[f"{self.env_prefix}_USERNAME"]
+        robin_pass = os.environ[f"{self.env_prefix}_PASSWORD"]
+        auth_app = os.environ[f"{self.env_prefix}_AUTH"]
+        totp = pyotp.TOTP(auth_app).now()
+        return self.rs.login(username=robin_user, password=robin_pass, mfa_code=totp, store_session=store_session,
+                             expiresIn=expires_in, pickle_name=self.pickle_name)
+
+    def logout(self):
+        self.rs.logout()
+
+    def build_holdings(self):
+        return self.rs.account.build_holdings()
+
+    def load_account_profile(self, info=None):
+        return self.rs.profiles.load_account_profile(info=info)
+
+    def get_quotes(self, ticker_list):
+        return self.rs.stocks.get_quotes(ticker_list)
+
+    def get_fundamentals(self, ticker_list):
+        return self.rs.stocks.get_fundamentals(ticker_list)
+
+    def get_stock_historicals(self, ticker_list, interval, span):
+        return self.rs.stocks.get_stock_historicals(ticker_list, interval=interval, span=span)
+
+    def get_top_100(self):
+        return self.rs.markets.get_top_100()
+
+    def order_buy_fractional_by_price(self, ticker_symbol, amount):
+        return self.rs.orders.order_buy_fractional_by_price(ticker_symbol, amount)
+
+    def order_sell_fractional_by_price(self, ticker_symbol, amount):
+        return self.rs.orders.order_sell_fractional_by_price(ticker_symbol, amount)
+
+    def order_sell_fractional_by_quantity(self, ticker_symbol, quantity):
+        return self.rs.orders.order_sell_fractional_by_quantity(ticker_symbol, quantity)
+
+    def get_stock_order_info(self, order_id):
+        return self.rs.orders.get_stock_order_info(order_id)
+
+    def cancel_all_stock_orders(self):
+        return self.rs.orders.cancel_all_stock_orders()
+
+    def get_crypto_positions(self):
+        return self.rs.crypto.get_crypto_positions()
+
+    def get_crypto_quote(self, ticker_symbol, info=None):
+        return self.rs.crypto.get_crypto_quote(ticker_symbol, info=info)
+
+    def get_crypto_quotes(self, ticker_list):
+        # robin_stocks only gets one crypto quote per request, but the quotes endpoint takes many pair ids
+        ticker_list = as_list(ticker_list)
+        if any(symbol not in self.crypto_pair_ids for symbol in ticker_list):
+            pairs = self.rs.helper.request_get(
+                self.rs.urls.crypto_currency_pairs_url(), 'results')
+            # a failed lookup isn't cached, so it's tried again next time
+            self.crypto_pair_ids.update({pair['asset_currency']['code']: pair['id']
+                                         for pair in pairs or [] if pair})
+        symbols_by_id = {self.crypto_pair_ids[symbol]: symbol
+                         for symbol in ticker_list if symbol in self.crypto_pair_ids}
+        if not symbols_by_id:
+            return None
+        # the quote url without an id is the endpoint for many quotes
+        quotes = self.rs.helper.request_get(self.rs.urls.crypto_quote_url("").rstrip("/") + "/", 'results',
+                                            {'ids': ','.join(symbols_by_id)})
+        if quotes is None or quotes == [None]:
+            return quotes
+        return [dict(quote, symbol=symbols_by_id[quote['id']]) for quote in quotes if quote]
+
+    def get_crypto_historicals(self, ticker_symbol, interval, span, info=None):
+        return self.rs.crypto.get_crypto_historicals(ticker_symbol, interval=interval, span=span, info=info)
+
+    def order_buy_crypto_by_price(self, ticker_symbol, amount):
+        return self.rs.orders.order_buy_crypto_by_price(ticker_symbol, amount)
+
+    def order_sell_crypto_by_price(self, ticker_symbol, amount):
+        return self.rs.orders.order_sell_crypto_by_price(ticker_symbol, amount)
+
+    def order_sell_crypto_by_quantity(self, ticker_symbol, quantity):
+        return self.rs.orders.order_sell_crypto_by_quantity(ticker_symbol, quantity)
+
+    def get_crypto_order_info(self, order_id):
+        return self.rs.orders.get_crypto_order_info(order_id)
+
+
+class FakeBroker:
+    # An in-memory Robinhood account that returns responses shaped like robin_stocks'. Orders fill immediately
+    # at the current quote and update buying power and positions.
+    # holdings and crypto_holdings map symbols to (quantity, average_buy_price), quotes and year_highs map
+    # symbols to prices, and historicals maps symbols to prices in span, oldest first. session_time is when a
+    # stored session was issued, by clock.
+    def __init__(self, buying_power=0, quotes=None, year_highs=None, historicals=None, holdings=None,
+                 crypto_holdings=None, top_100=None, session_time=None, clock=time.time):
+        self.buying_power = float(buying_power)
+        self.quotes = dict(quotes or {})
+        self.year_highs = dict(year_highs or {})
+        self.historicals = dict(historicals or {})
+        self.holdings = {symbol: list(holding)
+                         for symbol, holding in (holdings or {}).items()}
+        self.crypto_holdings = {symbol: list(holding)
+                                for symbol, holding in (crypto_holdings or {}).items()}
+        self.top_100 = list(top_100 or [])
+        self.orders = {}
+        self.order_ids = itertools.count(1)
+        self.session_time = session_time
+        self.clock = clock
+
+    def login(self, store_session=False, expires_in=86400, force=False):
+        # like robin_stocks, a stored session is reused until it expires unless force is given
+        if force or not store_session or self.session_time is None or \
+                self.clock() - self.session_time >= expires_in:
+            self.session_time = self.clock()
+        return {'access_token': 'fake', 'detail': 'logged in with fake broker'}
+
+    def stored_session_time(self):
+        return self.session_time
+
+    def logout(self):
+        pass
+
+    def build_holdings(self):
+        holdings = {}
+        for symbol, (quantity, average_buy_price) in self.holdings.items():
+            price = self.quotes[symbol]
+            holdings[symbol] = {'price': str(price), 'quantity': str(quantity),
+                                'average_buy_price': str(average_buy_price),
+                                'equity': "{0:.2f}".format(quantity * price)}
+        return holdings
+
+    def load_account_profile(self, info=None):
+        profile = {'buying_power': str(self.buying_power)}
+        return profile.get(info) if info else profile
+
+    def get_quotes(self, ticker_list):
+        return [{'symbol': symbol, 'last_trade_price': str(self.quotes[symbol])}
+                for symbol in as_list(ticker_list) if symbol in self.quotes]
+
+    def get_fundamentals(self, ticker_list):
+        return [{'symbol': symbol, 'high_52_weeks': str(self.year_highs[symbol])}
+                for symbol in as_list(ticker_list) if symbol in self.year_highs]
+
+    def get_stock_historicals(self, ticker_list, interval, span):
+        return [bar for symbol in as_list(ticker_list)
+                for bar in get_bars(symbol, self.historicals.get(symbol, []), interval)]
+
+    def get_top_100(self):
+        return self.get_quotes(self.top_100)
+
+    def order_buy_fractional_by_price(self, ticker_symbol, amount):
+        return self.fill(self.holdings, ticker_symbol, 'buy', amount / self.quotes[ticker_symbol])
+
+    def order_sell_fractional_by_price(self, ticker_symbol, amount):
+        return self.fill(self.holdings, ticker_symbol, 'sell', amount / self.quotes[ticker_symbol])
+
+    def order_sell_fractional_by_quantity(self, ticker_symbol, quantity):
+        return self.fill(self.holdings, ticker_symbol, 'sell', quantity)
+
+    def get_stock_order_info(self, order_id):
+        return self.orders.get(order_id)
+
+    def cancel_all_stock_orders(self):
+        return []
+
+    def get_crypto_positions(self):
+        return [{'currency': {'code': symbol}, 'quantity': str(quantity),
+                 'cost_bases': [{'direct_cost_basis': str(quantity * average_buy_price),
+                                 'direct_quantity': str(quantity)}]}
+                for symbol, (quantity, average_buy_price) in self.crypto_holdings.items()]
+
+    def get_crypto_quote(self, ticker_symbol, info=None):
+        quote = {'symbol': ticker_symbol,
+                 'mark_price': str(self.quotes[ticker_symbol])}
+        return quote.get(info) if info else quote
+
+    def get_crypto_quotes(self, ticker_list):
+        return [self.get_crypto_quote(symbol) for symbol in as_list(ticker_list) if symbol in self.quotes]
+
+    def get_crypto_historicals(self, ticker_symbol, interval, span, info=None):
+        ticker_symbol = as_list(ticker_symbol)[0]
+        if span == 'year':
+            bars = get_bars(
+                ticker_symbol, [self.year_highs[ticker_symbol]], interval)
+        else:
+            bars = get_bars(
+                ticker_symbol, self.historicals.get(ticker_symbol, []), interval)
+        return [bar[info] for bar in bars] if info else bars
+
+    def order_buy_crypto_by_price(self, ticker_symbol, amount):
+        return self.fill(self.crypto_holdings, ticker_symbol, 'buy', amount / self.quotes[ticker_symbol])
+
+    def order_sell_crypto_by_price(self, ticker_symbol, amount):
+        return self.fill(self.crypto_holdings, ticker_symbol, 'sell', amount / self.quotes[ticker_symbol])
+
+    def order_sell_crypto_by_quantity(self, ticker_symbol, quantity):
+        return self.fill(self.crypto_holdings, ticker_symbol, 'sell', quantity)
+
+    def get_crypto_order_info(self, order_id):
+        return self.orders.get(order_id)
+
+    def fill(self, holdings, ticker_symbol, side, quantity):
+        price = self.quotes[ticker_symbol]
+        held, average_buy_price = holdings.get(ticker_symbol, (0, 0))
+        if side == 'buy':
+            if quantity * price > self.buying_power:
+                return {'detail': f"You can only purchase {self.buying_power / price} shares of {ticker_symbol}."}
+            average_buy_price = (held * average_buy_price +
+                                 quantity * price) / (held + quantity)
+            holdings[ticker_symbol] = [held + quantity, average_buy_price]
+            self.buying_power -= quantity * price
+        else:
+            if quantity > held + 1e-9:
+                if holdings is self.crypto_holdings:
+                    return {'non_field_errors': ['Insufficient holdings.']}
+                return {'detail': 'Not enough shares to sell.'}
+            if held - quantity > 1e-9:
+                holdings[ticker_symbol] = [held - quantity, average_buy_price]
+            else:
+                holdings.pop(ticker_symbol)
+            self.buying_power += quantity * price
+
+        order_id = f"fake-{next(self.order_ids)}"
+        self.orders[order_id] = {'id': order_id, 'symbol': ticker_symbol, 'side': side, 'state': 'filled',
+                                 'quantity': str(quantity), 'cumulative_quantity': str(quantity),
+                                 'average_price': str(price), 'price': str(price)}
+        return self.orders[order_id]
+
+
+def is_auth_failure(exception):
+    # robin_stocks raises this when called without a session, and requests when a token is rejected
+    if "can only be called when logged in" in str(exception):
+        return True
+    return getattr(getattr(exception, "response", None), "status_code", None) in (401, 403)
+
+
+def as_list(ticker_list):
+    return [ticker_list] if isinstance(ticker_list, str) else list(ticker_list)
+
+
+def get_bars(ticker_symbol, prices, interval):
+    # one bar per price, ending with the last completed interval
+    from bar_store import INTERVAL_SECONDS
+    interval_seconds = INTERVAL_SECONDS[interval]
+    end = int(time.time()) // interval_seconds * interval_seconds
+    bars = []
+    for i, price in enumerate(prices):
+        begins_at = datetime.fromtimestamp(
+            end - (len(prices) - i) * interval_seconds, timezone.utc)
+        bars.append({'symbol': ticker_symbol, 'begins_at': begins_at.strftime('%Y-%m-%dT%H:%M:%SZ'),
+                     'open_price': str(price), 'close_price': str(price),
+                     'high_price': str(price), 'low_price': str(price)})
+    return bars
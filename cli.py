@@ -0,0 +1,85 @@
+import time
+
+# startup time is counted from here, so it includes every import the command makes
+started = time.perf_counter()
+
+import argparse
+import json
+import runpy
+import sys
+
+
+def load_config(path=None):
+    # a JSON file, or a Python file defining config like example_config.py
+    if path is None:
+        import example_config
+        return example_config.config
+    if path.endswith(".json"):
+        with open(path) as config_file:
+            return json.load(config_file)
+    return runpy.run_path(path)["config"]
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        prog="robinbot", description="Run one RobinBot cycle.")
+    parser.add_argument("--config", help="config file to use instead of example_config.py")
+    parser.add_argument("--sandbox", action="store_true",
+                        help="decide on orders without placing them")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("sell", help="sell stocks in the portfolio that meet the sell conditions")
+    buy_top = commands.add_parser("buy-top", help="buy from the top 100 movers")
+    buy_top.add_argument("--limit", type=int,
+                         help="max number of stocks to buy")
+    buy_top.add_argument("--include-portfolio", action="store_true",
+                         help="also buy stocks already in the portfolio")
+    buy_universe = commands.add_parser("buy-universe", help="buy from the symbols in the universe file")
+    buy_universe.add_argument("--limit", type=int,
+                              help="max number of stocks to buy")
+    buy_universe.add_argument("--include-portfolio", action="store_true",
+                              help="also buy stocks already in the portfolio")
+    crypto = commands.add_parser("crypto", help="run a crypto cycle")
+    crypto.add_argument("crypto_command", choices=["sell", "buy", "monitor"],
+                        help="sell crypto in the portfolio, buy from the watchlist, or keep checking quotes and "
+                             "trade as soon as conditions are met")
+    return parser
+
+
+def run(args, config):
+    # robin_bot, and the broker modules it loads, are only imported once a command needs them
+    from robin_bot import RobinBot, RobinCryptoBot
+    if args.command == "crypto":
+        bot = RobinCryptoBot(**config, sandbox=args.sandbox)
+    else:
+        bot = RobinBot(**config, sandbox=args.sandbox)
+    print(f"Started in {time.perf_counter() - started:.3f}s", file=sys.stderr)
+    bot.login()
+    if args.command == "crypto" and args.crypto_command == "monitor":
+        from monitor import CryptoMonitor
+        # the monitor logs out when it stops
+        CryptoMonitor(bot, config.get("monitor_poll_interval", 5)).run_forever()
+        return []
+    try:
+        if args.command == "sell":
+            return bot.sell_portfolio()
+        if args.command == "buy-top":
+            return bot.buy_from_top_stocks(args.limit, args.include_portfolio)
+        if args.command == "buy-universe":
+            return bot.buy_from_universe(args.limit, args.include_portfolio)
+        if args.crypto_command == "sell":
+            return bot.sell_portfolio()
+        return bot.buy_from_ticker_list(sorted(bot.get_crypto_portfolio_and_watchlist_symbols()))
+    finally:
+        bot.logout()
+
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+    results = run(args, load_config(args.config))
+    for result in results if isinstance(results, list) else [results]:
+        print(result)
+    print(f"Finished in {time.perf_counter() - started:.3f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import logging
+import signal
+import sys
+import time
+
+from broker import is_auth_failure
+
+logger = logging.getLogger("robinbot.daemon")
+
+
+class RobinBotDaemon:
+    # Keeps one bot, and its session and caches, alive between cycles. cycles is a list of dicts like
+    # {"method": "buy_from_top_stocks", "every": 900, "kwargs": {"buy_limit": 5}}, each running that bot method
+    # every given number of seconds. The session is only refreshed once it is within refresh_margin seconds of
+    # session_ttl, counted from when it was issued, or after a cycle fails because it isn't authenticated. clock gives
+    # the time in seconds since the epoch, as stored session times are.
+    def __init__(self, bot, cycles, session_ttl=86400, refresh_margin=600, clock=time.time, sleep=time.sleep):
+        self.bot = bot
+        self.cycles = [dict(cycle, next_run=0) for cycle in cycles]
+        self.session_ttl = session_ttl
+        self.refresh_margin = refresh_margin
+        self.clock = clock
+        self.sleep = sleep
+        self.logged_in_at = None
+        self.session_failed = False
+        self.running = False
+
+    def ensure_session(self):
+        broker = self.bot.broker
+        if self.logged_in_at is None:
+            # stored sessions let a restarted daemon reuse its tokens instead of doing the whole login again, but
+            # they're as old as when they were stored
+            broker.login(store_session=True, expires_in=self.session_ttl)
+            self.logged_in_at = broker.stored_session_time() or self.clock()
+            logger.info("Logged in.")
+        if self.session_failed or self.clock() - self.logged_in_at >= self.session_ttl - self.refresh_margin:
+            # a valid stored session would be returned unchanged, so a new one is forced
+            broker.login(store_session=True,
+                         expires_in=self.session_ttl, force=True)
+            self.logged_in_at = self.clock()
+            self.session_failed = False
+            logger.info("Session refreshed.")
+
+    def run_pending(self):
+        results = {}
+        for cycle in self.cycles:
+            if self.clock() < cycle["next_run"]:
+                continue
+            cycle["next_run"] = self.clock() + cycle["every"]
+            self.ensure_session()
+            try:
+                results[cycle["method"]] = getattr(
+                    self.bot, cycle["method"])(**cycle.get("kwargs", {}))
+                logger.info("%s result: %s", cycle["method"],
+                            results[cycle["method"]])
+            except Exception as exception:
+                # one failed cycle shouldn't stop the daemon, the next one gets a fresh try. Expired or revoked
+                # sessions make every request fail, so the session is renewed before then, but other failures keep it
+                logger.exception("%s failed.", cycle["method"])
+                if is_auth_failure(exception):
+                    self.session_failed = True
+        return results
+
+    def seconds_until_next_run(self):
+        return max(0, min(cycle["next_run"] for cycle in self.cycles) - self.clock())
+
+    def run_forever(self):
+        self.running = True
+        signal.signal(signal.SIGTERM, lambda signum, frame: self.stop())
+        try:
+            while self.running:
+                self.run_pending()
+                # sleep in short steps so a stop request is picked up quickly
+                self.sleep(min(1, self.seconds_until_next_run()))
+        finally:
+            self.bot.logout()
+
+    def stop(self):
+        self.running = False
+
+
+if __name__ == "__main__":
+    import example_config
+    from robin_bot import RobinBot, RobinCryptoBot
+    logging.basicConfig(level=logging.INFO,
+                        format="%(asctime)s %(levelname)s %(message)s")
+    bot_class = RobinCryptoBot if "--crypto" in sys.argv else RobinBot
+    bot = bot_class(**example_config.config, sandbox="--sandbox" in sys.argv)
+    daemon = RobinBotDaemon(bot, example_config.config["cycles"],
+                            example_config.config.get("session_ttl", 86400))
+    try:
+        daemon.run_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,57 @@
+import glob
+import os
+import threading
+import time
+
+import numpy as np
+
+# one record per symbol evaluated in a cycle. For sells reference_price is the average cost and price_change the
+# profit, and for buys they are the first price in span and the change since then.
+RECORD_DTYPE = np.dtype([("time", "<f8"), ("side", "<U4"), ("symbol", "<U16"), ("reason", "<U24"),
+                         ("action", "<U16"), ("order_id", "<U40"), ("current_price", "<f8"),
+                         ("reference_price", "<f8"), ("year_high", "<f8"), ("price_change", "<f8"),
+                         ("year_ratio", "<f8"), ("amount", "<f8"), ("evaluation_seconds", "<f8"),
+                         ("seconds", "<f8")])
+
+
+class DecisionLog:
+    # Buffers decision records and appends them to directory buffer_size at a time, each flush writing one new
+    # compressed .npz segment holding a column per field. Segments are never rewritten.
+    def __init__(self, directory, buffer_size=1000):
+        self.directory = directory
+        self.buffer_size = buffer_size
+        self.lock = threading.Lock()
+        self.records = []
+
+    def record(self, **fields):
+        record = tuple(fields.get(name, "" if RECORD_DTYPE[name].kind == "U" else np.nan)
+                       for name in RECORD_DTYPE.names)
+        with self.lock:
+            self.records.append(record)
+            full = len(self.records) >= self.buffer_size
+        if full:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            records, self.records = self.records, []
+        if not records:
+            return
+        columns = np.array(records, dtype=RECORD_DTYPE)
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{time.time_ns()}-{os.getpid()}.npz")
+        # written under a temporary name so readers never see a partial segment
+        with open(path + ".tmp", "wb") as segment_file:
+            np.savez_compressed(segment_file, **{name: columns[name] for name in RECORD_DTYPE.names})
+        os.replace(path + ".tmp", path)
+
+
+def load_decisions(directory, columns=None):
+    # every segment's records, oldest first, as a dict of column arrays. Only the given columns are read.
+    loaded = {name: [] for name in columns or RECORD_DTYPE.names}
+    for path in sorted(glob.glob(os.path.join(directory, "*.npz"))):
+        with np.load(path) as segment:
+            for name, arrays in loaded.items():
+                arrays.append(segment[name])
+    return {name: np.concatenate(arrays) if arrays else np.empty(0, RECORD_DTYPE[name])
+            for name, arrays in loaded.items()}
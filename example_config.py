@@ -14,6 +14,41 @@ config = {
     "crypto_watchlist": ['BTC', 'DOGE', 'ETC', 'BSV', 'BCH', 'LTC', 'ETC', 'ETH'],
     # the data point of a stock to run analysis on. Options are open_price, close_price, high_price, and low_price
     "data_point": "close_price",
+    # Number of seconds fetched holdings are reused before being fetched again. Order fills are applied to them in
+    # between. Set to None to only fetch them once
+    "holdings_ttl": 60,
+    # Number of seconds fetched prices, 52-week highs and historicals are reused before being fetched again
+    "market_data_ttl": 60,
+    # Max number of symbols requested at once when fetching market data in bulk
+    "market_data_chunk_size": 75,
+    # Number of threads used to fetch data and evaluate conditions for several symbols at once. Orders are still
+    # placed one at a time. Set to None to evaluate symbols sequentially
+    "workers": None,
+    # Max number of requests sent to Robinhood per second, and how many can be sent at once after a pause.
+    # Orders are sent ahead of waiting market data requests. Set to None to not limit requests
+    "requests_per_second": 5,
+    "request_burst": 10,
+    # Number of times a throttled or failed request is retried, with exponential backoff between tries
+    "request_retries": 3,
+    # Orders a cycle decides on are placed together, this many seconds apart, then their status is checked every
+    # order_poll_interval seconds until they're filled or order_poll_timeout seconds pass
+    "order_pace": 0,
+    "order_poll_interval": 1,
+    "order_poll_timeout": 10,
+    # File every Robinhood response is recorded to when the bot logs out. Set replay_from to a recorded file to run
+    # the bot on its responses instead of Robinhood, waiting replay_latency seconds per request
+    "record_to": None,
+    "replay_from": None,
+    "replay_latency": 0,
+    # Directory every buy and sell evaluation is recorded to, decision_log_buffer records at a time. Read it back with
+    # decision_log.load_decisions. Set to None to not record evaluations
+    "decision_log": None,
+    "decision_log_buffer": 1000,
+    # Directory historical prices are stored in, so that only new prices are downloaded. Set to None to download
+    # all historical prices in span every time
+    "bar_store": None,
+    # File listing the symbols buy_from_universe picks from, one per line
+    "universe": None,
     # Sets the interval for historical stock data that is retrieved.
     # Available options are '5minute', '10minute', 'hour', 'day', and 'week'. Interval must be less than span
     "interval": "day",
@@ -34,4 +69,18 @@ config = {
     "sell_fractional": True,
     # Determines whether stock shouldn't be bought if its currentPrice/52WeekHigh ratio goes above the given threshold
     "sell_year_threshold": 1,
+    # Bot methods run by daemon.py, each every given number of seconds
+    "cycles": [
+        {"method": "sell_portfolio", "every": 900},
+        {"method": "buy_from_top_stocks", "every": 900, "kwargs": {"buy_limit": 5}},
+    ],
+    # Number of seconds a daemon.py login session lasts before it is refreshed
+    "session_ttl": 86400,
+    # Number of seconds between the crypto quote checks of monitor.py
+    "monitor_poll_interval": 5,
+    # Accounts supervisor.py runs at once, each in its own process. Each logs in with the <env_prefix>_USERNAME,
+    # <env_prefix>_PASSWORD and <env_prefix>_AUTH environment variables, and its config overrides this one
+    "accounts": [
+        {"name": "main", "env_prefix": "ROBINHOOD", "crypto": False, "config": {}},
+    ],
 }
@@ -0,0 +1,100 @@
+import threading
+import time
+from collections import defaultdict
+
+# upper bounds, in seconds, of the call duration histogram buckets
+BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, float("inf"))
+
+
+class Instrumentation:
+    # Counts and times broker calls by method. Callbacks are called with (method_name, seconds, error) after every
+    # call, where error is the exception raised or error response returned, or None.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.callbacks = []
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.calls = defaultdict(int)
+            self.errors = defaultdict(int)
+            self.seconds = defaultdict(float)
+            self.buckets = defaultdict(lambda: [0] * len(BUCKETS))
+
+    def add_callback(self, callback):
+        self.callbacks.append(callback)
+
+    def record(self, method_name, seconds, error=None):
+        with self.lock:
+            self.calls[method_name] += 1
+            self.seconds[method_name] += seconds
+            if error is not None:
+                self.errors[method_name] += 1
+            buckets = self.buckets[method_name]
+            for i, upper_bound in enumerate(BUCKETS):
+                if seconds <= upper_bound:
+                    buckets[i] += 1
+                    break
+        for callback in self.callbacks:
+            callback(method_name, seconds, error)
+
+    def dump(self):
+        with self.lock:
+            return {method_name: {"calls": self.calls[method_name],
+                                  "errors": self.errors[method_name],
+                                  "seconds": self.seconds[method_name],
+                                  "buckets": dict(zip(map(str, BUCKETS), self.buckets[method_name]))}
+                    for method_name in sorted(self.calls)}
+
+    def to_prometheus(self, prefix="robinbot_broker"):
+        lines = [f"# TYPE {prefix}_calls_total counter",
+                 f"# TYPE {prefix}_errors_total counter",
+                 f"# TYPE {prefix}_call_seconds histogram"]
+        for method_name, stats in self.dump().items():
+            label = f'method="{method_name}"'
+            lines.append(f"{prefix}_calls_total{{{label}}} {stats['calls']}")
+            lines.append(f"{prefix}_errors_total{{{label}}} {stats['errors']}")
+            count = 0
+            for upper_bound, bucket_count in zip(BUCKETS, stats["buckets"].values()):
+                count += bucket_count
+                le = "+Inf" if upper_bound == float("inf") else upper_bound
+                lines.append(
+                    f'{prefix}_call_seconds_bucket{{{label},le="{le}"}} {count}')
+            lines.append(f"{prefix}_call_seconds_sum{{{label}}} {stats['seconds']}")
+            lines.append(f"{prefix}_call_seconds_count{{{label}}} {stats['calls']}")
+        return "\n".join(lines) + "\n"
+
+
+class InstrumentedBroker:
+    # Records every method call made on broker in instrumentation. Other attributes are passed through.
+    def __init__(self, broker, instrumentation):
+        self.broker = broker
+        self.instrumentation = instrumentation
+
+    def __getattr__(self, name):
+        attribute = getattr(self.broker, name)
+        if not callable(attribute):
+            return attribute
+
+        def instrumented(*args, **kwargs):
+            start = time.perf_counter()
+            error = None
+            try:
+                result = attribute(*args, **kwargs)
+                error = get_error(result)
+                return result
+            except Exception as exception:
+                error = exception
+                raise
+            finally:
+                self.instrumentation.record(
+                    name, time.perf_counter() - start, error)
+        return instrumented
+
+
+def get_error(result):
+    # robin_stocks returns errors as response dicts rather than raising
+    if isinstance(result, dict) and ('non_field_errors' in result or (
+            'detail' in result and 'id' not in result and 'access_token' not in result)):
+        return result
+    return None
@@ -0,0 +1,108 @@
+import threading
+import time
+
+
+class BulkCache:
+    # Caches one value per symbol. Missing or expired symbols are fetched together, chunk_size symbols per request.
+    # map_chunks can be given to fetch the chunks concurrently.
+    def __init__(self, fetch, ttl=None, chunk_size=75, map_chunks=map):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.chunk_size = chunk_size
+        self.map_chunks = map_chunks
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def is_stale(self, symbol):
+        if symbol not in self.values:
+            return True
+        if self.ttl is None:
+            return False
+        return time.monotonic() - self.values[symbol][1] > self.ttl
+
+    def load(self, symbols):
+        with self.lock:
+            missing = [symbol for symbol in dict.fromkeys(symbols) if self.is_stale(symbol)]
+        chunks = [missing[i:i + self.chunk_size]
+                  for i in range(0, len(missing), self.chunk_size)]
+        for values in self.map_chunks(self.fetch, chunks):
+            self.update(values)
+
+    def update(self, values):
+        fetched_at = time.monotonic()
+        with self.lock:
+            for symbol, value in values.items():
+                self.values[symbol] = (value, fetched_at)
+
+    def get(self, symbol):
+        if self.is_stale(symbol):
+            self.load([symbol])
+        return self.values[symbol][0]
+
+    def get_cached(self, symbols, default=float("nan")):
+        # the cached values for symbols without fetching any, default where there is none
+        with self.lock:
+            return [self.values[symbol][0] if symbol in self.values else default for symbol in symbols]
+
+    def invalidate(self, symbols=None):
+        with self.lock:
+            if symbols is None:
+                self.values.clear()
+            for symbol in symbols or []:
+                self.values.pop(symbol, None)
+
+    def export(self, symbols):
+        with self.lock:
+            return {symbol: self.values[symbol][0] for symbol in symbols if symbol in self.values}
+
+
+class MarketData:
+    # Current prices, 52-week highs and first prices in span for a bot, loaded for many symbols at once, and the
+    # top 100 movers.
+    def __init__(self, bot, ttl=None, chunk_size=75):
+        self.ttl = ttl
+        self.fetch_top_100 = bot.fetch_top_100
+        self.top_100 = None
+        self.top_100_fetched_at = None
+        self.prices = BulkCache(
+            bot.fetch_prices, ttl, chunk_size, bot.map_symbols)
+        self.year_highs = BulkCache(
+            bot.fetch_year_highs, ttl, chunk_size, bot.map_symbols)
+        self.first_prices = BulkCache(
+            bot.fetch_first_prices, ttl, chunk_size, bot.map_symbols)
+
+    def get_top_100(self):
+        if self.top_100 is None or (self.ttl is not None and time.monotonic() - self.top_100_fetched_at > self.ttl):
+            self.set_top_100(self.fetch_top_100())
+        return self.top_100
+
+    def set_top_100(self, top_100):
+        self.top_100 = top_100
+        self.top_100_fetched_at = time.monotonic()
+
+    def load(self, symbols):
+        symbols = list(symbols)
+        self.prices.load(symbols)
+        self.year_highs.load(symbols)
+        self.first_prices.load(symbols)
+
+    def invalidate(self, symbols=None):
+        if symbols is None:
+            self.top_100 = None
+        self.prices.invalidate(symbols)
+        self.year_highs.invalidate(symbols)
+        self.first_prices.invalidate(symbols)
+
+    def export(self, symbols, include_first_prices=True):
+        # what's cached for symbols, in a form that can be sent to another process and passed to seed()
+        return {"top_100": self.top_100,
+                "prices": self.prices.export(symbols),
+                "year_highs": self.year_highs.export(symbols),
+                "first_prices": self.first_prices.export(symbols) if include_first_prices else {}}
+
+    def seed(self, market_data):
+        if market_data["top_100"] is not None:
+            self.set_top_100(market_data["top_100"])
+        self.prices.update(market_data["prices"])
+        self.year_highs.update(market_data["year_highs"])
+        self.first_prices.update(market_data["first_prices"])
@@ -0,0 +1,155 @@
+import logging
+import signal
+import sys
+import time
+from collections import deque
+
+from bar_store import INTERVAL_SECONDS, SPAN_SECONDS, parse_time
+
+logger = logging.getLogger("robinbot.monitor")
+
+
+class RollingWindow:
+    # Prices over the last span seconds, one sample per interval, with the first price and the highest price in
+    # the window kept up to date as samples are added. Samples added within an interval of the last one only
+    # count towards the high.
+    def __init__(self, span, interval):
+        self.span = span
+        self.interval = interval
+        self.samples = deque()
+        # decreasing highs, so the first is the window's high
+        self.highs = deque()
+
+    def add(self, sample_time, price, high=None):
+        high = price if high is None else high
+        if self.samples and sample_time < self.samples[-1][0] + self.interval:
+            sample_time = self.samples[-1][0]
+        else:
+            self.samples.append((sample_time, price))
+        while self.highs and self.highs[-1][1] <= high:
+            self.highs.pop()
+        if not self.highs or self.highs[-1][0] != sample_time:
+            self.highs.append((sample_time, high))
+
+        start = sample_time - self.span
+        while self.samples and self.samples[0][0] < start:
+            self.samples.popleft()
+        while self.highs and self.highs[0][0] < start:
+            self.highs.popleft()
+
+    def first(self):
+        return self.samples[0][1] if self.samples else None
+
+    def high(self):
+        return self.highs[0][1] if self.highs else None
+
+
+class CryptoMonitor:
+    # Polls the quotes of a RobinCryptoBot's watchlist and held coins in one request per tick, and keeps the first
+    # price in span and the 52-week high of each in rolling windows seeded once from historicals. Sell and buy
+    # conditions are checked against the cached values every tick, but sell_with_conditions and
+    # buy_with_conditions only run when a symbol's conditions start being met.
+    def __init__(self, bot, poll_interval=5, clock=time.time, sleep=time.sleep):
+        self.bot = bot
+        self.poll_interval = poll_interval
+        self.clock = clock
+        self.sleep = sleep
+        self.spans = {}
+        self.years = {}
+        self.signals = {}
+        self.running = False
+
+    def add_symbols(self, symbols):
+        symbols = [symbol for symbol in symbols if symbol not in self.spans]
+        if not symbols:
+            return
+        bot = self.bot
+        for symbol in symbols:
+            self.spans[symbol] = RollingWindow(
+                SPAN_SECONDS[bot.span], INTERVAL_SECONDS[bot.interval])
+            self.years[symbol] = RollingWindow(
+                SPAN_SECONDS["year"], INTERVAL_SECONDS["day"])
+        for bar in bot.fetch_bars(symbols, bot.interval, bot.span) or []:
+            if bar and bar["symbol"] in self.spans:
+                self.spans[bar["symbol"]].add(parse_time(bar["begins_at"]), float(bar[bot.data_point]),
+                                              float(bar["high_price"]))
+        for bar in bot.fetch_bars(symbols, "day", "year") or []:
+            if bar and bar["symbol"] in self.years:
+                self.years[bar["symbol"]].add(parse_time(bar["begins_at"]), float(bar["close_price"]),
+                                              float(bar["high_price"]))
+
+    def tick(self):
+        bot = self.bot
+        symbols = sorted(bot.get_crypto_portfolio_and_watchlist_symbols())
+        self.add_symbols(symbols)
+        prices = bot.fetch_prices(symbols)
+        now = self.clock()
+
+        first_prices = {}
+        year_highs = {}
+        for symbol, price in prices.items():
+            self.spans[symbol].add(now, price)
+            self.years[symbol].add(now, price)
+            if self.spans[symbol].first() is not None:
+                first_prices[symbol] = self.spans[symbol].first()
+            year_highs[symbol] = self.years[symbol].high()
+        bot.market_data.prices.update(prices)
+        bot.market_data.first_prices.update(first_prices)
+        bot.market_data.year_highs.update(year_highs)
+
+        # only symbols whose conditions weren't met last tick are acted on
+        triggered = []
+        for symbol in prices:
+            for side, check in (("sell", bot.check_sell_conditions), ("buy", bot.check_buy_conditions)):
+                if side == "sell" and bot.get_shares(symbol) == 0:
+                    met = False
+                else:
+                    met = check(symbol) is None
+                if met and not self.signals.get((side, symbol)):
+                    triggered.append((side, symbol))
+                self.signals[(side, symbol)] = met
+
+        results = []
+        if triggered:
+            # buying power may have changed since the last trigger, so it's loaded again
+            bot.ledger.load()
+        for side, symbol in sorted(triggered, key=lambda trigger: trigger[0] != "sell"):
+            if side == "sell":
+                result = f"Sell {symbol} result: {bot.sell_with_conditions(symbol)}"
+            else:
+                result = f"Buy {symbol} result: {bot.buy_with_conditions(symbol)}"
+            logger.info(result)
+            results.append(result)
+        return results
+
+    def run_forever(self):
+        self.running = True
+        signal.signal(signal.SIGTERM, lambda signum, frame: self.stop())
+        try:
+            while self.running:
+                started = self.clock()
+                try:
+                    self.tick()
+                except Exception:
+                    # a failed tick shouldn't stop the monitor, the next one gets a fresh try
+                    logger.exception("Tick failed.")
+                self.sleep(max(0, self.poll_interval - (self.clock() - started)))
+        finally:
+            self.bot.logout()
+
+    def stop(self):
+        self.running = False
+
+
+if __name__ == "__main__":
+    import example_config
+    from robin_bot import RobinCryptoBot
+    logging.basicConfig(level=logging.INFO,
+                        format="%(asctime)s %(levelname)s %(message)s")
+    bot = RobinCryptoBot(**example_config.config, sandbox="--sandbox" in sys.argv)
+    bot.login()
+    monitor = CryptoMonitor(bot, example_config.config.get("monitor_poll_interval", 5))
+    try:
+        monitor.run_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,99 @@
+import itertools
+import json
+import os
+import random
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from backtest import BAR_FIELDS, Backtest, Bars, load_bars
+
+# bars loaded by each worker process, and indicators computed for them, shared by every config the worker runs
+worker_bars = None
+worker_indicators = {}
+
+
+def save_bars(bars, directory):
+    # stores bars as .npy files so worker processes can memory-map them instead of each receiving a copy
+    os.makedirs(directory, exist_ok=True)
+    np.save(os.path.join(directory, "dates.npy"), np.asarray(bars.dates, dtype=str))
+    np.save(os.path.join(directory, "symbols.npy"), np.asarray(bars.symbols, dtype=str))
+    for field in BAR_FIELDS:
+        np.save(os.path.join(directory, f"{field}.npy"), bars.prices[field])
+
+
+def load_saved_bars(directory):
+    prices = {field: np.load(os.path.join(directory, f"{field}.npy"), mmap_mode="r")
+              for field in BAR_FIELDS}
+    return Bars(np.load(os.path.join(directory, "dates.npy")),
+                list(np.load(os.path.join(directory, "symbols.npy"))), prices)
+
+
+def parameter_grid(grid):
+    # {"profit_threshold": [.1, .15], ...} -> one dict per combination of values
+    keys = list(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*grid.values())]
+
+
+def random_parameters(ranges, count, seed=None):
+    # {"profit_threshold": (.05, .3), "span": ["week", "month"], ...} -> count dicts sampled from the ranges
+    generator = random.Random(seed)
+    parameter_sets = []
+    for _ in range(count):
+        parameters = {}
+        for key, values in ranges.items():
+            if isinstance(values, tuple):
+                parameters[key] = generator.uniform(*values)
+            else:
+                parameters[key] = generator.choice(values)
+        parameter_sets.append(parameters)
+    return parameter_sets
+
+
+def init_worker(bars_directory):
+    global worker_bars
+    worker_bars = load_saved_bars(bars_directory)
+    worker_indicators.clear()
+
+
+def run_config(config):
+    backtest = Backtest(worker_bars, **config)
+    key = (backtest.span_bars, backtest.data_point, backtest.year_bars)
+    if key not in worker_indicators:
+        worker_indicators[key] = backtest.compute_indicators()
+    return backtest.run(worker_indicators[key]).summary
+
+
+def score(summary):
+    # return per unit of drawdown, so configs that got the same return with smaller losses rank higher
+    return summary["total_return"] / max(summary["max_drawdown"], 1e-9)
+
+
+def sweep(bars_directory, parameter_sets, base_config=None, processes=None, chunksize=16):
+    # runs a backtest for each parameter set on top of base_config across a process pool, best score first
+    configs = [{**(base_config or {}), **parameters}
+               for parameters in parameter_sets]
+    with ProcessPoolExecutor(max_workers=processes, initializer=init_worker,
+                             initargs=(bars_directory,)) as executor:
+        summaries = list(executor.map(run_config, configs, chunksize=chunksize))
+
+    results = [{"parameters": parameters, **summary, "score": score(summary)}
+               for parameters, summary in zip(parameter_sets, summaries)]
+    return sorted(results, key=lambda result: result["score"], reverse=True)
+
+
+if __name__ == "__main__":
+    import example_config
+    bars_directory = sys.argv[1] + ".npy.d"
+    save_bars(load_bars(sys.argv[1]), bars_directory)
+    grid = {
+        "profit_threshold": [.05, .1, .15, .2, .3],
+        "buy_threshold": [-.1, -.05, 0, 1],
+        "buying_power_limit": [.05, .1, .2],
+        "avoid_year_threshold": [.2, .3, .5],
+        "buy_year_threshold": [.8, .9, .95],
+        "sell_year_threshold": [.9, 1],
+    }
+    for result in sweep(bars_directory, parameter_grid(grid), example_config.config)[:10]:
+        print(json.dumps(result))
@@ -0,0 +1,110 @@
+import time
+from contextlib import contextmanager
+
+# order states after which an order won't fill any further
+FINAL_STATES = {"filled", "cancelled", "rejected", "failed"}
+
+
+class Order:
+    # amount is in dollars, or in shares when shares is True. result is the broker's response to placing the order,
+    # and reserved is the buying power set aside for it until it reaches a final state.
+    def __init__(self, side, ticker_symbol, amount, shares=False):
+        self.side = side
+        self.ticker_symbol = ticker_symbol
+        self.amount = amount
+        self.shares = shares
+        self.id = None
+        self.state = "queued"
+        self.result = None
+        self.filled_quantity = 0.0
+        self.average_price = None
+        self.reserved = 0
+
+
+class OrderManager:
+    # Places a bot's orders and tracks them until they fill. Inside batch(), orders are queued instead of placed,
+    # then placed pace seconds apart when the batch ends and polled together until they reach a final state or
+    # poll_timeout seconds pass. Orders placed outside a batch are polled on their own. Each fill is applied to the
+    # bot's cached state through bot.apply_fill.
+    def __init__(self, bot, pace=0, poll_interval=1, poll_timeout=30, clock=time.monotonic, sleep=time.sleep):
+        self.bot = bot
+        self.pace = pace
+        self.poll_interval = poll_interval
+        self.poll_timeout = poll_timeout
+        self.clock = clock
+        self.sleep = sleep
+        self.batching = False
+        self.queued = []
+
+    def place(self, order):
+        # returns the queued order inside a batch, or the broker's response outside one
+        if self.batching:
+            self.queued.append(order)
+            return order
+        self.submit([order])
+        self.poll([order])
+        return order.result
+
+    @contextmanager
+    def batch(self):
+        if self.batching:
+            yield
+            return
+        self.batching = True
+        try:
+            yield
+        except Exception:
+            # none of the orders are placed if the cycle deciding on them fails
+            for order in self.queued:
+                order.state = "cancelled"
+                self.bot.release_order(order)
+            raise
+        finally:
+            self.batching = False
+            orders, self.queued = self.queued, []
+        self.submit(orders)
+        self.poll(orders)
+
+    def submit(self, orders):
+        for i, order in enumerate(orders):
+            if i and self.pace:
+                self.sleep(self.pace)
+            # one order failing doesn't stop the rest of the batch from being placed
+            try:
+                order.result = self.bot.submit_order(order)
+            except Exception as exception:
+                order.result = f"Order failed: {exception}"
+            self.update(order, order.result)
+
+    def poll(self, orders):
+        deadline = self.clock() + self.poll_timeout
+        pending = [order for order in orders if order.state not in FINAL_STATES]
+        while pending and self.clock() < deadline:
+            self.sleep(self.poll_interval)
+            for order in pending:
+                # a failed status request doesn't mean the order failed, so it's checked again next time
+                try:
+                    info = self.bot.get_order_info(order.id)
+                    if info:
+                        self.update(order, info)
+                except Exception:
+                    pass
+            pending = [order for order in pending if order.state not in FINAL_STATES]
+
+    def update(self, order, info):
+        if not isinstance(info, dict) or not info.get("id"):
+            # the order wasn't placed, e.g. the response was an error message
+            order.state = "failed"
+            self.bot.release_order(order)
+            return
+        order.id = info["id"]
+        order.state = info.get("state")
+        filled_quantity = float(info.get("cumulative_quantity") or 0)
+        if filled_quantity > order.filled_quantity:
+            price = float(info.get("average_price") or info.get("price"))
+            self.bot.apply_fill(
+                order, filled_quantity - order.filled_quantity, price)
+            order.filled_quantity = filled_quantity
+            order.average_price = price
+        if order.state in FINAL_STATES:
+            self.bot.release_order(order)
@@ -0,0 +1,120 @@
+import threading
+import time
+from collections import namedtuple
+
+Holding = namedtuple(
+    "Holding", ["symbol", "quantity", "average_buy_price", "equity", "price"])
+
+
+class PortfolioSnapshot:
+    # Holds one fetch of the portfolio, indexed by symbol, so a decision cycle doesn't refetch holdings per field.
+    # The snapshot is refetched once it is older than ttl seconds (never, if ttl is None) or after invalidate(), and
+    # order fills are applied to it in between.
+    def __init__(self, fetch_holdings, ttl=None):
+        self.fetch_holdings = fetch_holdings
+        self.ttl = ttl
+        self.holdings = None
+        self.fetched_at = None
+        self.lock = threading.RLock()
+
+    def is_stale(self):
+        if self.holdings is None:
+            return True
+        if self.ttl is None:
+            return False
+        return time.monotonic() - self.fetched_at > self.ttl
+
+    def get_holdings(self):
+        with self.lock:
+            if self.is_stale():
+                self.holdings = self.fetch_holdings()
+                self.fetched_at = time.monotonic()
+            return self.holdings
+
+    def get_holding(self, symbol):
+        return self.get_holdings().get(symbol)
+
+    def invalidate(self):
+        with self.lock:
+            self.holdings = None
+            self.fetched_at = None
+
+    def apply_fill(self, symbol, side, quantity, price):
+        # updates a fetched snapshot with an order fill instead of fetching the holdings again
+        with self.lock:
+            if self.holdings is None:
+                return
+            holding = self.holdings.get(symbol)
+            held = holding.quantity if holding else 0.0
+            average_buy_price = holding.average_buy_price if holding else 0.0
+            if side == "buy":
+                average_buy_price = (held * average_buy_price +
+                                     quantity * price) / (held + quantity)
+                held += quantity
+            else:
+                held -= quantity
+            if held <= 1e-9:
+                self.holdings.pop(symbol, None)
+            else:
+                self.holdings[symbol] = Holding(symbol=symbol, quantity=held, average_buy_price=average_buy_price,
+                                                equity=held * price, price=price)
+
+    def symbols(self):
+        return list(self.get_holdings().keys())
+
+    def total_equity(self):
+        return sum(holding.equity for holding in self.get_holdings().values())
+
+
+class AccountLedger:
+    # Buying power, equity and total value of the account, loaded once per cycle and kept current by applying the
+    # cycle's orders to them, simulated or placed. total is fixed at load, so every order in a cycle is sized
+    # against the same account value.
+    def __init__(self, fetch_buying_power, portfolio):
+        self.fetch_buying_power = fetch_buying_power
+        self.portfolio = portfolio
+        self.buying_power = None
+        self.equity = None
+        self.total = None
+        self.lock = threading.Lock()
+
+    def load(self):
+        buying_power = self.fetch_buying_power()
+        equity = self.portfolio.total_equity()
+        with self.lock:
+            self.buying_power = buying_power
+            self.equity = equity
+            # same formula as RobinBot.get_total_in_robinhood
+            self.total = buying_power + buying_power + equity
+
+    def ensure_loaded(self):
+        if self.buying_power is None:
+            self.load()
+
+    def invalidate(self):
+        with self.lock:
+            self.buying_power = None
+            self.equity = None
+            self.total = None
+
+    def reserve(self, amount):
+        # takes a buy order's amount out of buying power until it fills or fails
+        with self.lock:
+            if self.buying_power is not None:
+                self.buying_power -= amount
+
+    def release(self, amount):
+        with self.lock:
+            if self.buying_power is not None:
+                self.buying_power += amount
+
+    def apply_fill(self, side, amount):
+        # amount is the dollar value filled. Buys were already taken out of buying power when reserved.
+        with self.lock:
+            if self.buying_power is None:
+                return
+            if side == "buy":
+                self.equity += amount
+            else:
+                self.equity -= amount
+                self.buying_power += amount
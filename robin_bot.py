@@ -1,11 +1,26 @@
-import robin_stocks.robinhood as rs
-import os
-import pyotp
-from dotenv import load_dotenv
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from broker import RobinhoodBroker
+from cassette import RecordingBroker, ReplayBroker
+from instrumentation import InstrumentedBroker, Instrumentation
+from scheduler import RequestScheduler, ScheduledBroker
+from market_data import MarketData
+from orders import Order, OrderManager
+from portfolio import AccountLedger, Holding, PortfolioSnapshot
+import screening
+
+
+def get_result(result):
+    # the broker's response for placed orders, or the message explaining why nothing was ordered
+    return result.result if isinstance(result, Order) else result
 
 
 class RobinBot:
-    def __init__(self, sandbox=False, **kwargs):
+    share_decimals = 6
+
+    def __init__(self, sandbox=False, broker=None, **kwargs):
 
         self.interval = kwargs.get("interval")
         self.span = kwargs.get("span")
@@ -26,75 +41,140 @@ class RobinBot:
         self.sell_fractional = kwargs.get("sell_fractional")
         self.sell_year_threshold = kwargs.get("sell_year_threshold")
         self.span = kwargs.get("span")
+        self.workers = kwargs.get("workers")
+        self.universe = kwargs.get("universe")
         self.sandbox = sandbox  # won't actually execute orders if set to True
-        self.total_in_robinhood = None
+        # every broker call is rate limited and retried by self.scheduler, and each attempt is counted and timed
+        # in self.instrumentation
+        self.instrumentation = Instrumentation()
+        if broker is None:
+            broker = ReplayBroker(kwargs["replay_from"], kwargs.get("replay_latency", 0)) if kwargs.get(
+                "replay_from") else RobinhoodBroker()
+        if kwargs.get("record_to"):
+            broker = RecordingBroker(broker, kwargs["record_to"])
+        self.scheduler = RequestScheduler(kwargs.get("requests_per_second"), kwargs.get("request_burst", 1),
+                                          kwargs.get("request_retries", 3))
+        self.broker = ScheduledBroker(InstrumentedBroker(
+            broker, self.instrumentation), self.scheduler)
+        # orders decided on in a cycle are placed together and tracked until they fill
+        self.orders = OrderManager(self, kwargs.get("order_pace", 0), kwargs.get("order_poll_interval", 1),
+                                   kwargs.get("order_poll_timeout", 10))
+        self.portfolio = PortfolioSnapshot(
+            self.fetch_holdings, kwargs.get("holdings_ttl"))
+        # buying power and account value are loaded once per cycle and updated by the cycle's orders
+        self.ledger = AccountLedger(self.get_buying_power, self.portfolio)
+        # when set, historicals are kept on disk and only newer bars are downloaded. Modules that need numpy are
+        # only imported when they're used, so short runs start quickly
+        self.bar_store = None
+        if kwargs.get("bar_store"):
+            from bar_store import BarStore
+            self.bar_store = BarStore(kwargs["bar_store"])
+        self.market_data = MarketData(self, kwargs.get("market_data_ttl", 60),
+                                      kwargs.get("market_data_chunk_size", 75))
+        # when set, every evaluation is recorded in a columnar decision log, with what it was based on collected
+        # in its own dict until its result is known. Fields are noted to the evaluation the thread is running.
+        self.decision_log = None
+        if kwargs.get("decision_log"):
+            from decision_log import DecisionLog
+            self.decision_log = DecisionLog(
+                kwargs["decision_log"], kwargs.get("decision_log_buffer", 1000))
+        self.current_evaluation = threading.local()
 
     def login(self):
-        load_dotenv()
-        robin_user = os.environ["ROBINHOOD_USERNAME"]
-        robin_pass = os.environ["ROBINHOOD_PASSWORD"]
-        auth_app = os.environ['ROBINHOOD_AUTH']
-        totp = pyotp.TOTP(auth_app).now()
-        return rs.login(username=robin_user, password=robin_pass, mfa_code=totp, store_session=False)
+        return self.broker.login()
 
     def logout(self):
-        rs.logout()
+        if self.decision_log is not None:
+            self.decision_log.flush()
+        self.broker.logout()
 
     def cancel_all_orders(self):
-        rs.orders.cancel_all_stock_orders()
+        self.broker.cancel_all_stock_orders()
+
+    def map_symbols(self, function, ticker_list):
+        # runs function for each symbol, on a pool of self.workers threads when concurrency is enabled
+        ticker_list = list(ticker_list)
+        if not self.workers or self.workers < 2 or len(ticker_list) < 2:
+            return [function(ticker) for ticker in ticker_list]
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return list(executor.map(function, ticker_list))
 
     def sell_portfolio(self):
         ticker_list = self.get_portfolio_symbols()
-        index = 1
-        results = []
-
-        self.total_in_robinhood = self.get_total_in_robinhood()
-
-        for ticker in ticker_list:
-
-            if index > self.sell_limit:
-                results.append("Max number of stock sales reached.")
-                return results
-            index += 1
-            result = self.sell_with_conditions(
-                ticker)
-            result = f"Sell {ticker} result: {result}"
-            results.append(result)
+        candidates = ticker_list[:self.sell_limit]
+
+        self.ledger.load()
+        self.market_data.prices.load(candidates)
+        self.market_data.year_highs.load(candidates)
+
+        # conditions can be evaluated concurrently, and the orders are placed together once all are decided
+        evaluations, reasons = self.check_conditions(self.check_sell_conditions, candidates)
+        with self.orders.batch():
+            sales = []
+            for ticker, evaluation, reason in zip(candidates, evaluations, reasons):
+                with self.evaluating(evaluation):
+                    sales.append((ticker, reason if reason else self.sell_within_limits(ticker)))
+        for (ticker, result), evaluation in zip(sales, evaluations):
+            self.log_decision(evaluation, "sell", ticker, result)
+        results = [f"Sell {ticker} result: {get_result(result)}" for ticker, result in sales]
+
+        if len(ticker_list) > len(candidates):
+            results.append("Max number of stock sales reached.")
 
         if not results:
             return "No options to sell."
         return results
 
     def sell_with_conditions(self, ticker_symbol):
-
-        if self.total_in_robinhood is None:
-            self.total_in_robinhood = self.get_total_in_robinhood()
-
+        # placed as a batch of one, so the order is polled until it fills and its final state is logged
+        with self.evaluating({}) as evaluation, self.orders.batch():
+            reason = self.check_sell_conditions(ticker_symbol)
+            result = reason if reason else self.sell_within_limits(ticker_symbol)
+        self.log_decision(evaluation, "sell", ticker_symbol, result)
+        return get_result(result)
+
+    def check_sell_conditions(self, ticker_symbol):
+        # returns the reason a symbol shouldn't be sold, or None if it should be
+        started = time.perf_counter()
         current_shares = self.get_shares(ticker_symbol)
         if current_shares == 0:
-            return "No shares available for sale."
+            return self.note_check(started, screening.REASON_NAMES[screening.NO_SHARES],
+                                   "No shares available for sale.")
 
         average_cost = self.get_average_cost(ticker_symbol)
         current_price = self.get_current_price(ticker_symbol)
         profit = (current_price - average_cost) / average_cost
+        inputs = dict(current_price=current_price,
+                      reference_price=average_cost, price_change=profit)
 
         if profit < self.profit_threshold:
-            return f"Profit of sale does not meet profit threshold. ({'{:.2%}'.format(profit)})"
+            return self.note_check(started, screening.REASON_NAMES[screening.BELOW_PROFIT_THRESHOLD],
+                                   f"Profit of sale does not meet profit threshold. ({'{:.2%}'.format(profit)})",
+                                   **inputs)
 
         year_high = self.get_52_week_high(ticker_symbol)
+        inputs.update(year_high=year_high, year_ratio=current_price / year_high)
 
         if current_price / year_high > self.sell_year_threshold:
-            return "Proximity to 52 week high exceeds threshold. Price: " + str(
-                current_price) + " 52-week high: " + str(year_high)
+            return self.note_check(started, screening.REASON_NAMES[screening.SELL_TOO_CLOSE_TO_HIGH],
+                                   "Proximity to 52 week high exceeds threshold. Price: " + str(
+                                       current_price) + " 52-week high: " + str(year_high), **inputs)
+        return self.note_check(started, screening.REASON_NAMES[screening.PASSED], None, **inputs)
+
+    def sell_within_limits(self, ticker_symbol):
+        self.ledger.ensure_loaded()
+        total_in_robinhood = self.ledger.total
 
+        current_shares = self.get_shares(ticker_symbol)
+        current_price = self.get_current_price(ticker_symbol)
         sell_amount = self.get_symbol_equity(ticker_symbol)
         current_equity = sell_amount
 
         if sell_amount == 0 or self.sell_fractional is False:
             return self.sell(current_shares, ticker_symbol, True)
 
-        if sell_amount / self.total_in_robinhood > self.portfolio_sell_threshold:
-            sell_amount = self.portfolio_sell_threshold * self.total_in_robinhood
+        if sell_amount / total_in_robinhood > self.portfolio_sell_threshold:
+            sell_amount = self.portfolio_sell_threshold * total_in_robinhood
 
         # if sale amount < dollar limit, sell as shares as opposed to price to avoid $1 sale restriction
         if sell_amount < self.sell_dollar_limit:
@@ -109,84 +189,128 @@ class RobinBot:
         return self.sell(sell_amount, ticker_symbol)
 
     def sell(self, sell_amount, ticker_symbol, shares=False):
+        dollars = sell_amount * self.get_current_price(ticker_symbol) if shares else sell_amount
+        self.note_evaluation(amount=dollars)
         if self.sandbox:
+            self.ledger.apply_fill("sell", dollars)
             return f"Sandbox mode enabled. Simulated sell amount for {ticker_symbol} is ${sell_amount}"
         if shares:
-            result = rs.orders.order_sell_fractional_by_quantity(
-                ticker_symbol, round(sell_amount, 6))
-            return result
-        result = rs.orders.order_sell_fractional_by_price(
-            ticker_symbol, sell_amount)
-
-        if result.get('detail') == 'Not enough shares to sell.':
-            total_shares = self.get_shares(ticker_symbol)
-            result = rs.orders.order_sell_fractional_by_quantity(
-                ticker_symbol, total_shares)
-            return result
-        return result
+            sell_amount = round(sell_amount, self.share_decimals)
+        return self.orders.place(Order("sell", ticker_symbol, sell_amount, shares))
 
     def buy_from_top_stocks(self, buy_limit=None,
                             include_stocks_in_portfolio=False):
-
-        portfolio_symbols = self.get_portfolio_symbols(
-        ) if include_stocks_in_portfolio else []
-
         top_stock_limit = 100 if not buy_limit else buy_limit
         top_stocks = self.get_top_n_stocks(top_stock_limit)
-        negative_price_changes_for_top_stocks = {
-            k: v for k, v in self.get_price_changes(top_stocks, descending=True).items() if v < 0}
-
-        if not include_stocks_in_portfolio:
-            elligible_stocks = {key: value for key, value in negative_price_changes_for_top_stocks.items(
-            ) if key not in portfolio_symbols}
-        else:
-            elligible_stocks = negative_price_changes_for_top_stocks
-
-        if not elligible_stocks:
+        return self.buy_from_screen(top_stocks, buy_limit, include_stocks_in_portfolio)
+
+    def buy_from_universe(self, buy_limit=None, include_stocks_in_portfolio=False):
+        # same as buy_from_top_stocks, but picks from the symbols listed in the universe file
+        return self.buy_from_screen(screening.load_universe(self.universe), buy_limit, include_stocks_in_portfolio)
+
+    def screen(self, ticker_list, include_stocks_in_portfolio=False):
+        self.market_data.load(ticker_list)
+        portfolio_symbols = [] if include_stocks_in_portfolio else self.get_portfolio_symbols()
+        return screening.screen(ticker_list,
+                                self.market_data.prices.get_cached(ticker_list),
+                                self.market_data.first_prices.get_cached(
+                                    ticker_list),
+                                self.market_data.year_highs.get_cached(
+                                    ticker_list),
+                                portfolio_symbols, self.buy_threshold, self.avoid_year_threshold,
+                                self.buy_year_threshold)
+
+    def buy_from_screen(self, ticker_list, buy_limit=None, include_stocks_in_portfolio=False):
+        started = time.perf_counter()
+        screen_result = self.screen(ticker_list, include_stocks_in_portfolio)
+        evaluations = self.note_screen(screen_result, started)
+
+        if not len(screen_result.ranking):
+            self.log_screen(screen_result, evaluations, {})
             return "No negative change for given stocks."
 
-        self.total_in_robinhood = self.get_total_in_robinhood()
-
-        results = []
-        index = 1
-        for key in elligible_stocks:
-
-            if buy_limit:
-                if index > buy_limit:
-                    result = f"Max number of stock purchases reached ({buy_limit})"
-                    results.append(result)
-                    return results
-
-            result = self.buy_with_conditions(key)
-            result = f"Buy {key} result: {result}"
+        self.ledger.load()
+
+        candidates = screen_result.ranking[:buy_limit]
+        purchases = {}
+        with self.orders.batch():
+            for i in candidates:
+                key = str(screen_result.symbols[i])
+                with self.evaluating(evaluations[i]):
+                    if screen_result.reasons[i] == screening.PASSED:
+                        result = self.buy_within_limits(key)
+                    else:
+                        result = screening.describe(screen_result, i)
+                purchases[int(i)] = result
+        self.log_screen(screen_result, evaluations, purchases)
+        results = [f"Buy {screen_result.symbols[i]} result: {get_result(result)}" for i, result in purchases.items()]
+
+        if len(screen_result.ranking) > len(candidates):
+            result = f"Max number of stock purchases reached ({buy_limit})"
             results.append(result)
-            index += 1
 
         return results
 
     def buy_from_ticker_list(self, ticker_list):
-        results = []
-        for ticker in ticker_list:
-            results.append(self.buy_with_conditions(ticker))
-        return results
+        self.ledger.load()
+        self.market_data.load(ticker_list)
+        evaluations, reasons = self.check_conditions(self.check_buy_conditions, ticker_list)
+        with self.orders.batch():
+            results = []
+            for ticker, evaluation, reason in zip(ticker_list, evaluations, reasons):
+                with self.evaluating(evaluation):
+                    results.append(reason if reason else self.buy_within_limits(ticker))
+        for ticker, evaluation, result in zip(ticker_list, evaluations, results):
+            self.log_decision(evaluation, "buy", ticker, result)
+        return [get_result(result) for result in results]
 
     def buy_with_conditions(self, ticker_symbol):
-
-        if self.total_in_robinhood is None:
-            self.total_in_robinhood = self.get_total_in_robinhood()
-
-        buying_power = self.get_buying_power()
-        buy_amount = buying_power * self.buying_power_limit
+        with self.evaluating({}) as evaluation, self.orders.batch():
+            reason = self.check_buy_conditions(ticker_symbol)
+            result = reason if reason else self.buy_within_limits(ticker_symbol)
+        self.log_decision(evaluation, "buy", ticker_symbol, result)
+        return get_result(result)
+
+    def check_buy_conditions(self, ticker_symbol):
+        # returns the reason a symbol shouldn't be bought, or None if it should be
+        started = time.perf_counter()
         price_change = self.get_price_change(ticker_symbol)
         current_price = self.get_current_price(ticker_symbol)
         year_high = self.get_52_week_high(ticker_symbol)
+        inputs = dict(current_price=current_price, reference_price=self.market_data.first_prices.get(ticker_symbol),
+                      year_high=year_high, price_change=price_change, year_ratio=current_price / year_high)
+
+        if price_change < self.buy_threshold:
+            if current_price / year_high > self.avoid_year_threshold:
+                if current_price / year_high < self.buy_year_threshold:
+                    return self.note_check(started, screening.REASON_NAMES[screening.PASSED], None, **inputs)
+                else:
+                    return self.note_check(started, screening.REASON_NAMES[screening.TOO_CLOSE_TO_HIGH],
+                                           f"Price too close to 52-week high threshold. Price: {current_price}. "
+                                           f"52-week high: {year_high}", **inputs)
+            else:
+                return self.note_check(started, screening.REASON_NAMES[screening.TOO_FAR_FROM_HIGH],
+                                       f"Price too far from 52-week high threshold. Price: {current_price}. "
+                                       f"52-week high: {year_high}", **inputs)
+        else:
+            return self.note_check(started, screening.REASON_NAMES[screening.ABOVE_BUY_THRESHOLD],
+                                   f"Price decrease lower than buy threshold. ({'{:.2%}'.format(price_change)})",
+                                   **inputs)
+
+    def buy_within_limits(self, ticker_symbol):
+        # earlier orders in the cycle are already taken out of the ledger's buying power
+        self.ledger.ensure_loaded()
+        buying_power = self.ledger.buying_power
+        total_in_robinhood = self.ledger.total
+        buy_amount = buying_power * self.buying_power_limit
 
         if buying_power < self.buy_dollar_limit:
+            self.note_evaluation(reason="low_buying_power")
             return f"Buying power less than dollar limit ({buying_power})"
 
         # check if purchase takes up too much of portfolio
-        if buy_amount / self.total_in_robinhood > self.portfolio_buy_threshold:
-            buy_amount = self.portfolio_buy_threshold * self.total_in_robinhood
+        if buy_amount / total_in_robinhood > self.portfolio_buy_threshold:
+            buy_amount = self.portfolio_buy_threshold * total_in_robinhood
 
         if buy_amount / buying_power > self.buying_power_limit:
             buy_amount = buying_power * self.buying_power_limit
@@ -194,54 +318,208 @@ class RobinBot:
         if buy_amount < self.buy_dollar_limit:
             buy_amount = self.buy_dollar_limit
 
-        if price_change < self.buy_threshold:
-            if current_price / year_high > self.avoid_year_threshold:
-                if current_price / year_high < self.buy_year_threshold:
-                    return self.buy(ticker_symbol=ticker_symbol, buy_amount=buy_amount)
-                else:
-                    return f"Price too close to 52-week high threshold. Price: {current_price}. 52-week high: {year_high}"
-            else:
-                return f"Price too far from 52-week high threshold. Price: {current_price}. 52-week high: {year_high}"
-        else:
-            return f"Price decrease lower than buy threshold. ({'{:.2%}'.format(price_change)})"
+        return self.buy(ticker_symbol=ticker_symbol, buy_amount=buy_amount)
 
     def buy(self, ticker_symbol, buy_amount):
+        self.note_evaluation(amount=buy_amount)
         if self.sandbox:
+            self.ledger.reserve(buy_amount)
+            self.ledger.apply_fill("buy", buy_amount)
             return f"Sandbox mode enabled. Simulated buy amount for {ticker_symbol} is ${buy_amount}"
-        result = rs.orders.order_buy_fractional_by_price(
-            ticker_symbol, buy_amount)
-        if result.get('detail') is not None:
-            while 'You can only purchase' in result.get(
-                    'detail'):
-                buy_amount = buy_amount * .90
-                if buy_amount < self.buy_dollar_limit:
-                    return "Fraction too small to purchase (" + str(buy_amount) + ")"
-            result = rs.orders.order_buy_fractional_by_price(
-                ticker_symbol, buy_amount)
-
-        return result
+        order = Order("buy", ticker_symbol, buy_amount)
+        order.reserved = buy_amount
+        self.ledger.reserve(buy_amount)
+        return self.orders.place(order)
+
+    def submit_order(self, order):
+        # order requests aren't retried on an empty response, so None here means the order failed
+        if order.side == "buy":
+            result = self.order_buy_by_price(order.ticker_symbol, order.amount)
+            while isinstance(result, dict) and 'You can only purchase' in (result.get('detail') or ''):
+                order.amount = order.amount * .90
+                if order.amount < self.buy_dollar_limit:
+                    return "Fraction too small to purchase (" + str(order.amount) + ")"
+                result = self.order_buy_by_price(
+                    order.ticker_symbol, order.amount)
+            return result if result is not None else "No response to buy order."
+
+        if order.shares:
+            result = self.order_sell_by_quantity(
+                order.ticker_symbol, order.amount)
+            return result if result is not None else "No response to sell order."
+        result = self.order_sell_by_price(order.ticker_symbol, order.amount)
+        if isinstance(result, dict) and self.is_insufficient_shares(result):
+            # the cached holdings were out of date, so sell everything actually held
+            self.portfolio.invalidate()
+            result = self.order_sell_by_quantity(
+                order.ticker_symbol, self.get_shares(order.ticker_symbol))
+        return result if result is not None else "No response to sell order."
+
+    def apply_fill(self, order, quantity, price):
+        self.portfolio.apply_fill(
+            order.ticker_symbol, order.side, quantity, price)
+        self.ledger.apply_fill(order.side, quantity * price)
+
+    def release_order(self, order):
+        # gives back the part of a buy order's reserved buying power that wasn't spent
+        if order.reserved:
+            self.ledger.release(
+                order.reserved - order.filled_quantity * (order.average_price or 0))
+            order.reserved = 0
+
+    def order_buy_by_price(self, ticker_symbol, buy_amount):
+        return self.broker.order_buy_fractional_by_price(ticker_symbol, buy_amount)
+
+    def order_sell_by_price(self, ticker_symbol, sell_amount):
+        return self.broker.order_sell_fractional_by_price(ticker_symbol, sell_amount)
+
+    def order_sell_by_quantity(self, ticker_symbol, quantity):
+        return self.broker.order_sell_fractional_by_quantity(ticker_symbol, quantity)
+
+    def is_insufficient_shares(self, result):
+        return result.get('detail') == 'Not enough shares to sell.'
+
+    def get_order_info(self, order_id):
+        return self.broker.get_stock_order_info(order_id)
+
+    @contextmanager
+    def evaluating(self, evaluation):
+        # fields noted by this thread until the block ends go to evaluation
+        previous = getattr(self.current_evaluation, "fields", None)
+        self.current_evaluation.fields = evaluation
+        try:
+            yield evaluation
+        finally:
+            self.current_evaluation.fields = previous
+
+    def check_conditions(self, check, ticker_list):
+        # runs check on every symbol, and returns each one's evaluation and result, so a symbol listed twice is
+        # evaluated and logged twice
+        evaluations = [{} for _ in ticker_list]
+
+        def run_check(i):
+            with self.evaluating(evaluations[i]):
+                return check(ticker_list[i])
+        return evaluations, self.map_symbols(run_check, range(len(ticker_list)))
+
+    def note_evaluation(self, **fields):
+        evaluation = getattr(self.current_evaluation, "fields", None)
+        if self.decision_log is not None and evaluation is not None:
+            evaluation.update(fields)
+
+    def note_check(self, started, reason, message, **inputs):
+        # notes a condition check that started at started, and returns its message
+        self.note_evaluation(time=time.time(), started=started, reason=reason,
+                             evaluation_seconds=time.perf_counter() - started, **inputs)
+        return message
+
+    def note_screen(self, screen_result, started):
+        # an evaluation for each symbol in the screen
+        evaluations = [{} for _ in screen_result.symbols]
+        if self.decision_log is None:
+            return evaluations
+        # the screen evaluates every symbol at once, so each is counted as an equal share of its time
+        evaluation_seconds = (time.perf_counter() - started) / \
+            max(len(screen_result.symbols), 1)
+        for i, evaluation in enumerate(evaluations):
+            current_price = float(screen_result.current_prices[i])
+            price_change = float(screen_result.price_changes[i])
+            year_high = float(screen_result.year_highs[i])
+            evaluation.update(time=time.time(), started=started,
+                              reason=screening.REASON_NAMES[int(
+                                  screen_result.reasons[i])],
+                              current_price=current_price, reference_price=current_price / (1 + price_change),
+                              year_high=year_high, price_change=price_change,
+                              year_ratio=current_price / year_high, evaluation_seconds=evaluation_seconds)
+        return evaluations
+
+    def log_screen(self, screen_result, evaluations, results):
+        # results maps the indexes decided on to their results, and the rest of the screen is logged as held
+        if self.decision_log is None:
+            return
+        for i, symbol in enumerate(map(str, screen_result.symbols)):
+            if i in results:
+                self.log_decision(evaluations[i], "buy", symbol, results[i])
+            elif screen_result.reasons[i] == screening.PASSED:
+                self.log_decision(evaluations[i], "buy", symbol, None, "limit_reached")
+            else:
+                self.log_decision(evaluations[i], "buy", symbol, None, "held")
+
+    def log_decision(self, evaluation, side, ticker_symbol, result, action=None):
+        if self.decision_log is None:
+            return
+        fields = dict(evaluation)
+        order_id = ""
+        if isinstance(result, Order):
+            order_id, action = result.id or "", result.state
+        elif isinstance(result, dict):
+            order_id, action = result.get('id') or "", result.get('state') or "failed"
+        elif action is None:
+            action = "simulated" if "amount" in fields else "held"
+        started = fields.pop("started", None)
+        fields.setdefault("time", time.time())
+        self.decision_log.record(side=side, symbol=ticker_symbol, action=action, order_id=order_id,
+                                 seconds=time.perf_counter() - started if started else float("nan"), **fields)
+
+    def fetch_holdings(self):
+        holdings = {}
+        for symbol, item in self.broker.build_holdings().items():
+            holdings[symbol] = Holding(symbol=symbol,
+                                       quantity=float(item.get('quantity')),
+                                       average_buy_price=float(
+                                           item.get('average_buy_price')),
+                                       equity=float(item.get('equity')),
+                                       price=float(item.get('price')))
+        return holdings
 
     def get_portfolio_symbols(self):
-        portfolio_items = rs.account.build_holdings()
-        ticker_symbols = list(portfolio_items.keys())
-        return ticker_symbols
+        return self.portfolio.symbols()
 
     def get_average_cost(self, ticker_symbol):
-        return float((rs.account.build_holdings().get(ticker_symbol)).get('average_buy_price'))
+        return self.portfolio.get_holding(ticker_symbol).average_buy_price
 
     def get_historical_prices(self, ticker_symbol):
-        return rs.stocks.get_stock_historicals(ticker_symbol, interval=self.interval, span=self.span)
+        return self.broker.get_stock_historicals(ticker_symbol, self.interval, self.span)
+
+    def fetch_prices(self, ticker_list):
+        quotes = self.broker.get_quotes(ticker_list) or []
+        return {quote['symbol']: float(quote['last_trade_price']) for quote in quotes if quote}
+
+    def fetch_top_100(self):
+        return self.broker.get_top_100()
+
+    def fetch_year_highs(self, ticker_list):
+        fundamentals = self.broker.get_fundamentals(ticker_list) or []
+        return {item['symbol']: float(item['high_52_weeks']) for item in fundamentals if item}
+
+    def fetch_bars(self, ticker_list, interval, span):
+        return self.broker.get_stock_historicals(ticker_list, interval, span)
+
+    def fetch_first_prices(self, ticker_list):
+        if self.bar_store:
+            self.bar_store.update(ticker_list, self.interval,
+                                  self.span, self.fetch_bars)
+            first_prices = {ticker: self.bar_store.first_price(
+                ticker, self.interval, self.span, self.data_point) for ticker in ticker_list}
+            return {ticker: price for ticker, price in first_prices.items() if price is not None}
+
+        # historicals for multiple symbols are returned one symbol after another, oldest first
+        first_prices = {}
+        for item in self.broker.get_stock_historicals(ticker_list, self.interval, self.span) or []:
+            if item and item['symbol'] not in first_prices:
+                first_prices[item['symbol']] = float(item.get(self.data_point))
+        return first_prices
 
     def get_current_price(self, ticker_symbol):
-        return float(rs.markets.get_stock_quote_by_symbol(ticker_symbol).get('last_trade_price'))
+        return self.market_data.prices.get(ticker_symbol)
 
     def get_price_change(self, ticker_symbol):
-        stock_historical_prices = self.get_historical_prices(ticker_symbol)
-        first_price = float(stock_historical_prices[0].get(self.data_point))
+        first_price = self.market_data.first_prices.get(ticker_symbol)
         current_price = self.get_current_price(ticker_symbol)
         return (current_price - first_price) / first_price
 
     def get_price_changes(self, ticker_list, descending=False):
+        self.market_data.load(ticker_list)
         price_changes = {}
         for ticker in ticker_list:
             price_changes[ticker] = self.get_price_change(ticker)
@@ -250,131 +528,118 @@ class RobinBot:
     def get_top_n_stocks(self, limit=100):
         if limit > 100:
             raise Exception("Limit for top n movers is 100.")
-        ticker_list = rs.markets.get_top_100(info='symbol')
-        ticker_list = ticker_list[:limit]
-        return ticker_list
+        top_stocks = [quote for quote in self.market_data.get_top_100() if quote][:limit]
+        # the top 100 endpoint returns quotes, so their prices don't need to be fetched again
+        self.market_data.prices.update(
+            {quote['symbol']: float(quote['last_trade_price']) for quote in top_stocks})
+        return [quote['symbol'] for quote in top_stocks]
 
     def get_symbol_equity(self, ticker_symbol):
-        portfolio_items = rs.account.build_holdings()
-        return float((portfolio_items.get(ticker_symbol)).get('equity'))
+        return self.portfolio.get_holding(ticker_symbol).equity
 
     def get_total_equity(self):
-        stock_portfolio_dict = rs.account.build_holdings()
-        portfolioEquity = 0
-        for value in stock_portfolio_dict.values():
-            portfolioEquity += (float(value.get('equity')))
-        return portfolioEquity
+        return self.portfolio.total_equity()
 
     def get_shares(self, ticker_symbol):
-        portfolio_items = rs.account.build_holdings()
-        return float((portfolio_items.get(ticker_symbol)).get('quantity'))
+        holding = self.portfolio.get_holding(ticker_symbol)
+        if holding is None:
+            return 0.0
+        return holding.quantity
 
     def get_buying_power(self):
-        return float(rs.profiles.load_account_profile(info='buying_power'))
+        return float(self.broker.load_account_profile(info='buying_power'))
 
     def get_total_invested(self):
         return self.get_buying_power() + self.get_total_equity()
 
     def get_total_in_robinhood(self):
-        return self.get_buying_power() + self.get_total_invested()
+        # buying power is counted twice, as get_buying_power() + get_total_invested() always has, but fetched once
+        buying_power = self.get_buying_power()
+        return buying_power + buying_power + self.get_total_equity()
 
     def get_52_week_high(self, ticker_symbol):
-        return float(rs.stocks.get_fundamentals(ticker_symbol, info='high_52_weeks')[0])
+        return self.market_data.year_highs.get(ticker_symbol)
 
 
 class RobinCryptoBot(RobinBot):
+    share_decimals = 8
+
     def __init__(self, **kwargs):
         # robin_stocks does not currently support getting top movers for crypto, so I need to set ones to watch manually
         self.crypto_watchlist = kwargs.get("crypto_watchlist")
         super().__init__(**kwargs)
 
-    def sell(self, sell_amount, ticker_symbol, shares=False):
-        if shares:
-            result = rs.orders.order_sell_crypto_by_quantity(
-                ticker_symbol, round(sell_amount, 8))
-            return result
+    def order_buy_by_price(self, ticker_symbol, buy_amount):
+        return self.broker.order_buy_crypto_by_price(ticker_symbol, buy_amount)
+
+    def order_sell_by_price(self, ticker_symbol, sell_amount):
+        return self.broker.order_sell_crypto_by_price(ticker_symbol, sell_amount)
 
-        result = rs.orders.order_sell_crypto_by_price(
-            ticker_symbol, sell_amount)
+    def order_sell_by_quantity(self, ticker_symbol, quantity):
+        return self.broker.order_sell_crypto_by_quantity(ticker_symbol, quantity)
 
-        if result.get('non_field_errors') == ['Insufficient holdings.']:
-            total_shares = self.get_shares(ticker_symbol)
-            result = rs.orders.order_sell_crypto_by_quantity(
-                ticker_symbol, total_shares)
-            return result
+    def is_insufficient_shares(self, result):
+        return result.get('non_field_errors') == ['Insufficient holdings.']
 
-        return result
+    def get_order_info(self, order_id):
+        return self.broker.get_crypto_order_info(order_id)
 
     def buy_from_top_stocks(self):
         raise NotImplementedError(
             "buy_from_top_stocks not available for RobinCryptoBot.")
 
-    def get_portfolio_symbols(self):
-        crypto_portfolio_items = rs.crypto.get_crypto_positions()
-        crypto_portfolio_symbol_list = []
-        for x in crypto_portfolio_items:
-            if float(x['cost_bases'][0]['direct_cost_basis']) > 0:
-                crypto_symbol = (x.get('currency')).get('code')
-                if crypto_symbol != 'USD':
-                    crypto_portfolio_symbol_list.append(crypto_symbol)
-            return crypto_portfolio_symbol_list
+    def fetch_holdings(self):
+        # builds every position from one positions request, priced by one quotes request
+        positions = {}
+        for position in self.broker.get_crypto_positions():
+            code = position['currency']['code']
+            cost_basis = position['cost_bases'][0]
+            if code != 'USD' and float(cost_basis['direct_cost_basis']) > 0:
+                positions[code] = (float(cost_basis['direct_quantity']),
+                                   float(cost_basis['direct_cost_basis']))
+        self.market_data.prices.load(positions)
+
+        holdings = {}
+        for code, (quantity, cost_basis) in positions.items():
+            price = self.get_current_price(code)
+            holdings[code] = Holding(symbol=code, quantity=quantity, average_buy_price=cost_basis / quantity,
+                                     equity=quantity * price, price=price)
+        return holdings
 
     def get_crypto_portfolio_and_watchlist_symbols(self):
-        return (set(self.crypto_watchlist.extend(self.get_portfolio_symbols())))
-
-    def get_average_cost(self, ticker_symbol):
-        crypto_portfolio_items = rs.crypto.get_crypto_positions()
-        for i, x in enumerate(crypto_portfolio_items):
-            code = (x.get('currency')).get('code')
-            if code == ticker_symbol:
-                costBasis = float((crypto_portfolio_items[i].get(
-                    'cost_bases')[0]).get('direct_cost_basis'))
-                quantity = float((crypto_portfolio_items[i].get(
-                    'cost_bases')[0]).get('direct_quantity'))
-                return costBasis / quantity
+        return set(self.crypto_watchlist) | set(self.get_portfolio_symbols())
 
     def get_historical_prices(self, ticker_symbol):
-        return rs.crypto.get_crypto_historicals(ticker_symbol, interval=self.interval, span=self.span)
-
-    def get_current_price(self, ticker):
-        return float(rs.crypto.get_crypto_quote(ticker, info='mark_price'))
-
-    def get_symbol_equity(self, ticker_symbol):
-        if ticker_symbol in self.get_portfolio_symbols():
-            return self.get_symbol_equity(ticker_symbol)
-        else:
-            raise Exception("Symbol is not in portfolio.")
+        return self.broker.get_crypto_historicals(ticker_symbol, self.interval, self.span)
+
+    def fetch_prices(self, ticker_list):
+        quotes = self.broker.get_crypto_quotes(ticker_list) or []
+        return {quote['symbol']: float(quote['mark_price']) for quote in quotes if quote}
+
+    def fetch_bars(self, ticker_list, interval, span):
+        # robin_stocks has no multi-symbol crypto historicals endpoint, so these are fetched per symbol
+        bars = self.map_symbols(lambda ticker: self.broker.get_crypto_historicals(
+            ticker, interval, span), ticker_list)
+        return [bar for symbol_bars in bars for bar in symbol_bars or []]
+
+    def fetch_year_highs(self, ticker_list):
+        if self.bar_store:
+            self.bar_store.update(ticker_list, 'day', 'year', self.fetch_bars)
+            year_highs = {ticker: self.bar_store.year_high(
+                ticker) for ticker in ticker_list}
+            return {ticker: year_high for ticker, year_high in year_highs.items() if year_high is not None}
+
+        year_highs = self.map_symbols(lambda ticker: max(float(high_price) for high_price in
+                                                         self.broker.get_crypto_historicals(
+                                                             ticker, 'day', 'year', info='high_price')), ticker_list)
+        return dict(zip(ticker_list, year_highs))
+
+    def fetch_first_prices(self, ticker_list):
+        if self.bar_store:
+            return super().fetch_first_prices(ticker_list)
+        first_prices = self.map_symbols(lambda ticker: float(
+            self.get_historical_prices(ticker)[0].get(self.data_point)), ticker_list)
+        return dict(zip(ticker_list, first_prices))
 
     def get_portfolio_equity(self):
-        crypto_ticker_dict = {}
-        crypto_portfolio_items = rs.crypto.get_crypto_positions()
-        for i, x in enumerate(crypto_portfolio_items):
-            code = (x.get('currency')).get('code')
-            if code != 'USD':
-                crypto_ticker_dict[code] = float(
-                    self.get_symbol_equity(code))
-        return crypto_ticker_dict
-
-    def get_total_equity(self):
-        return sum(self.get_portfolio_equity().values())
-
-    def get_symbol_equity(self, ticker_symbol):
-        crypto_portfolio_items = rs.crypto.get_crypto_positions()
-        for i, x in enumerate(crypto_portfolio_items):
-            code = (x.get('currency')).get('code')
-            if code == ticker_symbol:
-                quantity = float((crypto_portfolio_items[i].get(
-                    'cost_bases')[0]).get('direct_quantity'))
-                return quantity * self.get_current_price(code)
-
-    def get_shares(self, ticker_symbol):
-        crypto_portfolio_items = rs.crypto.get_crypto_positions()
-        for i, x in enumerate(crypto_portfolio_items):
-            code = (x.get('currency')).get('code')
-            if code == ticker_symbol:
-                quantity = float((crypto_portfolio_items[i].get(
-                    'cost_bases')[0]).get('direct_quantity'))
-                return quantity
-
-    def get_52_week_high(self, ticker_symbol):
-        return float(max(rs.crypto.get_crypto_historicals(ticker_symbol, 'day', 'year', info='high_price')))
+        return {code: holding.equity for code, holding in self.portfolio.get_holdings().items()}
@@ -0,0 +1,113 @@
+import heapq
+import itertools
+import random
+import re
+import threading
+import time
+
+ORDER_PRIORITY = 0
+READ_PRIORITY = 1
+
+
+class RequestScheduler:
+    # Lets broker calls through at up to rate calls per second, with bursts of up to burst calls. When calls are
+    # waiting on the rate limit, lower priority values go first, so orders aren't stuck behind a market data scan.
+    # Throttled and failed calls are retried up to max_retries times with exponential backoff.
+    # A rate of None doesn't limit calls, only retries them.
+    def __init__(self, rate=None, burst=1, max_retries=3, backoff=1, max_backoff=60, sleep=time.sleep):
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.sleep = sleep
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+        self.waiting = []
+        self.tickets = itertools.count()
+        self.condition = threading.Condition()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens +
+                          (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self, priority):
+        if self.rate is None:
+            return
+        with self.condition:
+            ticket = (priority, next(self.tickets))
+            heapq.heappush(self.waiting, ticket)
+            while True:
+                self.refill()
+                if self.waiting[0] == ticket and self.tokens >= 1:
+                    heapq.heappop(self.waiting)
+                    self.tokens -= 1
+                    self.condition.notify_all()
+                    return
+                timeout = (1 - self.tokens) / self.rate if self.waiting[0] == ticket else None
+                self.condition.wait(timeout)
+
+    def call(self, function, args=(), kwargs=None, priority=READ_PRIORITY, retry_empty=False):
+        # retry_empty retries calls that return None or [None], which is how robin_stocks reports failed GETs
+        attempt = 0
+        while True:
+            self.acquire(priority)
+            try:
+                result = function(*args, **(kwargs or {}))
+            except Exception as exception:
+                if attempt >= self.max_retries or not is_retryable_exception(exception):
+                    raise
+                delay = self.get_delay(attempt)
+            else:
+                if attempt >= self.max_retries or not is_retryable_result(result, retry_empty):
+                    return result
+                delay = self.get_delay(attempt, result)
+            self.sleep(delay)
+            attempt += 1
+
+    def get_delay(self, attempt, result=None):
+        # Robinhood says when a throttled request can be retried, e.g. "Request was throttled. Expected available
+        # in 8 seconds."
+        if isinstance(result, dict):
+            match = re.search(r"available in (\d+)", str(result.get('detail')))
+            if match:
+                return float(match.group(1))
+        delay = min(self.max_backoff, self.backoff * 2 ** attempt)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+
+class ScheduledBroker:
+    # Sends every method call made on broker through scheduler. Other attributes are passed through.
+    def __init__(self, broker, scheduler):
+        self.broker = broker
+        self.scheduler = scheduler
+
+    def __getattr__(self, name):
+        attribute = getattr(self.broker, name)
+        if not callable(attribute):
+            return attribute
+        priority = ORDER_PRIORITY if name.startswith(
+            ('order_', 'cancel_')) else READ_PRIORITY
+        # orders aren't retried on an empty response, since it doesn't mean the order wasn't placed
+        retry_empty = name.startswith(('get_', 'load_'))
+
+        def scheduled(*args, **kwargs):
+            return self.scheduler.call(attribute, args, kwargs, priority, retry_empty)
+        return scheduled
+
+
+def is_retryable_exception(exception):
+    response = getattr(exception, 'response', None)
+    status_code = getattr(response, 'status_code', None)
+    if status_code is not None:
+        return status_code == 429 or status_code >= 500
+    # connection errors and timeouts
+    return isinstance(exception, OSError)
+
+
+def is_retryable_result(result, retry_empty):
+    if isinstance(result, dict) and 'throttled' in str(result.get('detail')):
+        return True
+    return retry_empty and (result is None or result == [None])
@@ -0,0 +1,80 @@
+from collections import namedtuple
+
+# why a symbol was or wasn't picked to buy, checked in this order
+PASSED = 0
+MISSING_DATA = 1
+NOT_FALLING = 2
+IN_PORTFOLIO = 3
+ABOVE_BUY_THRESHOLD = 4
+TOO_FAR_FROM_HIGH = 5
+TOO_CLOSE_TO_HIGH = 6
+# why a held symbol was or wasn't sold, or PASSED
+NO_SHARES = 7
+BELOW_PROFIT_THRESHOLD = 8
+SELL_TOO_CLOSE_TO_HIGH = 9
+# how each code is written to the decision log
+REASON_NAMES = {PASSED: "passed", MISSING_DATA: "missing_data", NOT_FALLING: "not_falling",
+                IN_PORTFOLIO: "in_portfolio", ABOVE_BUY_THRESHOLD: "above_buy_threshold",
+                TOO_FAR_FROM_HIGH: "too_far_from_high", TOO_CLOSE_TO_HIGH: "too_close_to_high",
+                NO_SHARES: "no_shares", BELOW_PROFIT_THRESHOLD: "below_profit_threshold",
+                SELL_TOO_CLOSE_TO_HIGH: "sell_too_close_to_high"}
+
+# reasons holds one of the codes above per symbol. ranking holds the indices of the falling symbols outside the
+# portfolio, in the order buy_from_top_stocks considers them.
+ScreenResult = namedtuple("ScreenResult", [
+    "symbols", "price_changes", "current_prices", "year_highs", "reasons", "ranking"])
+
+
+def load_universe(path):
+    # one symbol per line, blank lines and lines starting with # are skipped
+    with open(path) as universe_file:
+        lines = (line.split("#")[0].strip().upper() for line in universe_file)
+        return list(dict.fromkeys(line for line in lines if line))
+
+
+def screen(symbols, current_prices, first_prices, year_highs, portfolio_symbols, buy_threshold,
+           avoid_year_threshold, buy_year_threshold):
+    # applies RobinBot.check_buy_conditions to every symbol at once. Prices are NaN where data is missing.
+    # numpy is imported here so that bots which never screen don't pay for importing it
+    import numpy as np
+    import signals
+    symbols = np.asarray(symbols, dtype=str)
+    current_prices = np.asarray(current_prices, dtype=float)
+    year_highs = np.asarray(year_highs, dtype=float)
+    price_changes = signals.price_changes(
+        current_prices, np.asarray(first_prices, dtype=float))
+    price_ratios = signals.price_ratios(current_prices, year_highs)
+
+    missing_data = np.isnan(price_changes) | np.isnan(price_ratios)
+    in_portfolio = np.isin(symbols, list(portfolio_symbols))
+    reasons = np.select(
+        [missing_data, price_changes >= 0, in_portfolio, price_changes >= buy_threshold,
+         price_ratios <= avoid_year_threshold, price_ratios >= buy_year_threshold],
+        [MISSING_DATA, NOT_FALLING, IN_PORTFOLIO, ABOVE_BUY_THRESHOLD,
+         TOO_FAR_FROM_HIGH, TOO_CLOSE_TO_HIGH],
+        PASSED)
+
+    candidates = np.flatnonzero(
+        ~missing_data & (price_changes < 0) & ~in_portfolio)
+    ranking = candidates[np.argsort(-price_changes[candidates], kind="stable")]
+    return ScreenResult(symbols, price_changes, current_prices, year_highs, reasons, ranking)
+
+
+def describe(result, i):
+    # the message RobinBot.check_buy_conditions gives for the same outcome
+    reason = result.reasons[i]
+    current_price = float(result.current_prices[i])
+    year_high = float(result.year_highs[i])
+    if reason == MISSING_DATA:
+        return "Missing price data."
+    if reason == NOT_FALLING:
+        return "Price did not decrease."
+    if reason == IN_PORTFOLIO:
+        return "Already in portfolio."
+    if reason == ABOVE_BUY_THRESHOLD:
+        return f"Price decrease lower than buy threshold. ({'{:.2%}'.format(result.price_changes[i])})"
+    if reason == TOO_FAR_FROM_HIGH:
+        return f"Price too far from 52-week high threshold. Price: {current_price}. 52-week high: {year_high}"
+    if reason == TOO_CLOSE_TO_HIGH:
+        return f"Price too close to 52-week high threshold. Price: {current_price}. 52-week high: {year_high}"
+    return None
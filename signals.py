@@ -0,0 +1,35 @@
+import numpy as np
+
+# Array versions of the threshold checks in RobinBot.check_buy_conditions and RobinBot.check_sell_conditions.
+# Every argument can be a scalar or a NumPy array, so a whole universe of symbols (or bars) is checked at once.
+
+
+def price_ratios(current_price, year_high):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.asarray(current_price, dtype=float) / year_high
+
+
+def price_changes(current_price, first_price):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (np.asarray(current_price, dtype=float) - first_price) / first_price
+
+
+def buy_mask(price_change, price_ratio, buy_threshold, avoid_year_threshold, buy_year_threshold):
+    return ((price_change < buy_threshold)
+            & (price_ratio > avoid_year_threshold)
+            & (price_ratio < buy_year_threshold))
+
+
+def sell_mask(profit, price_ratio, profit_threshold, sell_year_threshold):
+    return (profit >= profit_threshold) & (price_ratio <= sell_year_threshold)
+
+
+def rolling_max(values, window):
+    # max of the last window rows (including the current one) for each row of a 2D bars x symbols array
+    values = np.where(np.isnan(values), -np.inf, values)
+    padded = np.concatenate(
+        [np.full((window - 1,) + values.shape[1:], -np.inf), values])
+    windows = np.lib.stride_tricks.sliding_window_view(padded, window, axis=0)
+    result = windows.max(axis=-1)
+    result[np.isinf(result)] = np.nan
+    return result
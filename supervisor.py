@@ -0,0 +1,181 @@
+import multiprocessing
+import pickle
+import queue
+import time
+
+from broker import RobinhoodBroker
+from robin_bot import RobinBot, RobinCryptoBot
+
+# the settings first prices depend on, which must match for a worker to use the shared ones
+HISTORY_KEYS = ("interval", "span", "data_point")
+
+
+def get_broker(account):
+    return RobinhoodBroker(account.get("env_prefix", "ROBINHOOD"))
+
+
+def get_bot(account, config, get_broker):
+    bot_class = RobinCryptoBot if account.get("crypto") else RobinBot
+    return bot_class(**{**config, **account.get("config", {})}, sandbox=account.get("sandbox", False),
+                     broker=get_broker(account))
+
+
+def seed_market_data(bot, market_data):
+    # first prices are only shared with bots that compute them the same way
+    if tuple(getattr(bot, key) for key in HISTORY_KEYS) != market_data["history"]:
+        market_data = dict(market_data, first_prices={})
+    bot.market_data.seed(market_data)
+
+
+def fetch_market_data(bot, symbols):
+    symbols = list(dict.fromkeys(bot.get_top_n_stocks(100) + symbols))
+    bot.market_data.load(symbols)
+    return dict(bot.market_data.export(symbols), history=tuple(getattr(bot, key) for key in HISTORY_KEYS))
+
+
+def run_cycles(bot, account, market_data, cycles):
+    cycle_results = {}
+    try:
+        if market_data is not None and not account.get("crypto"):
+            seed_market_data(bot, market_data)
+    except Exception as exception:
+        # the bot can still fetch what it needs itself
+        cycle_results["seed_market_data"] = f"Failed: {exception}"
+    for cycle in cycles:
+        try:
+            cycle_results[cycle["method"]] = getattr(
+                bot, cycle["method"])(**cycle.get("kwargs", {}))
+        except Exception as exception:
+            cycle_results[cycle["method"]] = f"Failed: {exception}"
+    return cycle_results
+
+
+def run_worker(account, config, get_broker, tasks, results):
+    # Runs in its own process, so its robin_stocks session is separate from every other account's. Tasks are
+    # (sequence, "market_data", symbols) or (sequence, "cycles", (market_data, cycles)), and each is answered on
+    # results with (account name, sequence, result), where the result of cycles is ({method: result}, broker stats).
+    try:
+        bot = get_bot(account, config, get_broker)
+        bot.login()
+        error = None
+    except Exception as exception:
+        bot, error = None, exception
+    try:
+        for sequence, kind, payload in iter(tasks.get, None):
+            try:
+                if bot is None:
+                    raise Exception(f"Worker failed to start: {error}")
+                if kind == "market_data":
+                    result = fetch_market_data(bot, payload)
+                else:
+                    result = (run_cycles(bot, account, *payload),
+                              bot.instrumentation.dump())
+                # results are pickled by a background thread, where an error would be lost, so it's checked here
+                pickle.dumps(result)
+            except Exception as exception:
+                result = None if kind == "market_data" else (
+                    {cycle["method"]: f"Failed: {exception}" for cycle in payload[1]}, {})
+            results.put((account["name"], sequence, result))
+    finally:
+        if bot is not None:
+            bot.logout()
+
+
+class Supervisor:
+    # Runs one bot per account, each in its own process with its own login. accounts are dicts like
+    # {"name": "main", "env_prefix": "ROBINHOOD", "crypto": False, "config": {...}}, where config overrides the
+    # shared config. Market data every stock account uses (the top 100 movers and their quotes, 52-week highs and
+    # first prices, plus any symbols given) is fetched once per cycle by the first stock account's worker and sent
+    # to the others. Workers that die are reported as failed and started again on the next cycle, and a cycle
+    # that takes longer than cycle_timeout seconds is reported as timed out.
+    def __init__(self, accounts, config, get_broker=get_broker, symbols=None, cycle_timeout=None,
+                 stop_timeout=30, check_interval=1):
+        self.accounts = accounts
+        self.config = config
+        self.get_broker = get_broker
+        self.symbols = list(symbols or [])
+        self.cycle_timeout = cycle_timeout
+        self.stop_timeout = stop_timeout
+        self.check_interval = check_interval
+        self.context = multiprocessing.get_context("spawn")
+        self.workers = {}
+        self.results = None
+        # every task is numbered, so a late answer to an earlier one isn't taken as the answer to the current one
+        self.sequence = 0
+        stock_accounts = [account["name"] for account in accounts if not account.get("crypto")]
+        self.market_data_account = stock_accounts[0] if stock_accounts else None
+
+    def start(self):
+        self.results = self.context.Queue()
+        for account in self.accounts:
+            self.start_worker(account)
+
+    def start_worker(self, account):
+        tasks = self.context.Queue()
+        process = self.context.Process(target=run_worker, name=f"robinbot-{account['name']}",
+                                       args=(account, self.config, self.get_broker, tasks, self.results))
+        process.start()
+        self.workers[account["name"]] = (process, tasks)
+
+    def send(self, names, kind, payload):
+        # sends a task to names' workers, and returns the results of it, or an error message for each worker that
+        # died or didn't answer in time
+        self.sequence += 1
+        for name in names:
+            self.workers[name][1].put((self.sequence, kind, payload))
+        results = {}
+        deadline = time.monotonic() + self.cycle_timeout if self.cycle_timeout else None
+        while len(results) < len(names):
+            try:
+                name, sequence, result = self.results.get(timeout=self.check_interval)
+                if sequence == self.sequence and name in names:
+                    results[name] = result
+                continue
+            except queue.Empty:
+                pass
+            for name in names:
+                process = self.workers[name][0]
+                if name not in results and not process.is_alive():
+                    results[name] = f"Worker exited with code {process.exitcode}."
+            if deadline is not None and time.monotonic() > deadline:
+                for name in names:
+                    results.setdefault(name, f"Worker timed out after {self.cycle_timeout} seconds.")
+        return results
+
+    def fetch_market_data(self):
+        if self.market_data_account is None:
+            return None
+        market_data = self.send([self.market_data_account], "market_data", self.symbols)[self.market_data_account]
+        # without shared market data, every worker fetches its own
+        return market_data if isinstance(market_data, dict) else None
+
+    def run_cycle(self, cycles):
+        # runs cycles on every account at once, and returns {account name: ({method: result}, broker stats)}
+        for account in self.accounts:
+            if not self.workers[account["name"]][0].is_alive():
+                self.start_worker(account)
+        market_data = self.fetch_market_data()
+        results = self.send(list(self.workers), "cycles", (market_data, cycles))
+        return {name: result if isinstance(result, tuple) else ({cycle["method"]: result for cycle in cycles}, {})
+                for name, result in results.items()}
+
+    def stop(self):
+        for process, tasks in self.workers.values():
+            tasks.put(None)
+        for process, tasks in self.workers.values():
+            process.join(self.stop_timeout)
+            if process.is_alive():
+                process.terminate()
+        self.workers = {}
+
+
+if __name__ == "__main__":
+    import example_config
+    supervisor = Supervisor(example_config.config["accounts"], example_config.config)
+    supervisor.start()
+    try:
+        for name, (cycle_results, stats) in supervisor.run_cycle(example_config.config["cycles"]).items():
+            for method, result in cycle_results.items():
+                print(f"{name} {method} result: {result}")
+    finally:
+        supervisor.stop()
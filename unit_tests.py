@@ -1,13 +1,65 @@
+import contextlib
+import io
+import json
+import os
+import tempfile
+import time
 import unittest
+import numpy as np
 import example_config
+from backtest import Backtest, build_bars
+from bar_store import BAR_DTYPE, BarStore
+import cli
+from benchmark import run_scenario
+from broker import FakeBroker, RobinhoodBroker
+from daemon import RobinBotDaemon
+from monitor import CryptoMonitor, RollingWindow
+from decision_log import load_decisions
+from optimizer import parameter_grid, save_bars, sweep
 from robin_bot import RobinBot, RobinCryptoBot
+from scheduler import ORDER_PRIORITY, RequestScheduler
+from supervisor import Supervisor
+import screening
+
+
+# the fake broker doesn't need requests to be rate limited
+offline_config = {**example_config.config, "requests_per_second": None}
+
+
+def get_fake_broker():
+    stock_prices = {'AAPL': 150, 'AMZN': 95, 'GOOGL': 110,
+                    'MSFT': 300, 'NFLX': 320, 'TSLA': 200}
+    crypto_prices = {'BTC': 30000, 'DOGE': .07, 'ETC': 18,
+                     'BSV': 35, 'BCH': 120, 'LTC': 80, 'ETH': 1900}
+    quotes = {**stock_prices, **crypto_prices}
+    return FakeBroker(
+        buying_power=1000,
+        quotes=quotes,
+        year_highs={symbol: price * 1.25 for symbol, price in quotes.items()},
+        historicals={symbol: [price * 1.05, price * 1.02, price]
+                     for symbol, price in quotes.items()},
+        holdings={'AAPL': (2, 120), 'MSFT': (1, 310)},
+        crypto_holdings={'BTC': (.01, 25000), 'ETH': (.5, 2000)},
+        top_100=list(stock_prices))
+
+
+def get_account_broker(account):
+    if account.get("exit_code") is not None:
+        os._exit(account["exit_code"])
+    broker = get_fake_broker()
+    if account.get("delay"):
+        # the first holdings request takes delay seconds, as a stalled request would
+        build_holdings, delays = broker.build_holdings, [account["delay"]]
+        broker.build_holdings = lambda: (time.sleep(delays.pop()) if delays else None, build_holdings())[1]
+    return broker
 
 
 class TestRetrievalMethods(unittest.TestCase):
 
     def __init__(self, methodName: str = "runTest") -> None:
         super().__init__(methodName)
-        self.robin_bot = RobinBot(**example_config.config, sandbox=True)
+        self.robin_bot = RobinBot(
+            **offline_config, sandbox=True, broker=get_fake_broker())
 
     test_symbol = 'AAPL'
     test_symbol_list = ['AAPL', 'AMZN', 'GOOGL']
@@ -71,19 +123,203 @@ class TestRetrievalMethods(unittest.TestCase):
         print(sell_results)
         self.assertIsInstance(sell_results, list)
 
+    def test_instrumentation_counts_broker_calls(self):
+        calls = []
+        self.robin_bot.instrumentation.add_callback(
+            lambda method_name, seconds, error: calls.append(method_name))
+        self.robin_bot.get_buying_power()
+        stats = self.robin_bot.instrumentation.dump()
+        self.assertEqual(stats['load_account_profile']['calls'], 1)
+        self.assertEqual(calls, ['load_account_profile'])
+        self.assertIn('robinbot_broker_calls_total{method="load_account_profile"} 1',
+                      self.robin_bot.instrumentation.to_prometheus())
+
+    def test_bar_store_only_downloads_new_bars(self):
+        with tempfile.TemporaryDirectory() as bar_directory:
+            broker = get_fake_broker()
+            for _ in range(2):
+                robin_bot = type(self.robin_bot)(**{**offline_config, "bar_store": bar_directory},
+                                                 sandbox=True, broker=broker)
+                self.assertAlmostEqual(
+                    robin_bot.get_price_change(self.test_symbol), 1 / 1.05 - 1)
+                self.assertGreater(
+                    robin_bot.get_52_week_high(self.test_symbol), 0)
+            stats = robin_bot.instrumentation.dump()
+            self.assertNotIn('get_stock_historicals', stats)
+            self.assertNotIn('get_crypto_historicals', stats)
+
+    def test_buy_fills_against_broker(self):
+        self.robin_bot.sandbox = False
+        broker = self.robin_bot.broker
+        buy_result = self.robin_bot.buy(self.test_symbol, 10)
+        self.assertEqual(buy_result['state'], 'filled')
+        self.assertAlmostEqual(broker.buying_power, 990)
+        self.assertGreater(self.robin_bot.get_shares(self.test_symbol), 0)
+
+    def test_ledger_loads_account_once_per_cycle(self):
+        self.robin_bot.buy_from_ticker_list(self.test_symbol_list)
+        self.robin_bot.sell_portfolio()
+        stats = self.robin_bot.instrumentation.dump()
+        self.assertEqual(stats['load_account_profile']['calls'], 2)
+        # simulated buys are taken out of the budget like placed ones
+        self.robin_bot.ledger.load()
+        self.robin_bot.buy(self.test_symbol, 10)
+        self.assertAlmostEqual(self.robin_bot.ledger.buying_power, 990)
+        self.assertAlmostEqual(self.robin_bot.ledger.equity,
+                               self.robin_bot.get_total_equity() + 10)
+
+    def test_decision_log_records_each_evaluation(self):
+        with tempfile.TemporaryDirectory() as log_directory:
+            robin_bot = type(self.robin_bot)(**{**offline_config, "decision_log": log_directory},
+                                             sandbox=True, broker=get_fake_broker())
+            # the crypto watchlist lists ETC twice, and each is its own evaluation
+            ticker_list = self.test_symbol_list
+            robin_bot.sell_portfolio()
+            results = robin_bot.buy_from_ticker_list(ticker_list)
+            robin_bot.logout()
+            decisions = load_decisions(log_directory)
+            symbols = robin_bot.get_portfolio_symbols() + ticker_list
+            self.assertEqual(list(decisions['symbol']), symbols)
+            self.assertTrue(set(decisions['action']) <= {'held', 'simulated'})
+            buys = decisions['side'] == 'buy'
+            self.assertEqual(set(decisions['action'][buys]), {'simulated'})
+            self.assertEqual(list(decisions['amount'][buys]),
+                             [float(result.rsplit('$', 1)[1]) for result in results])
+            self.assertTrue(np.allclose(decisions['price_change'][buys], 1 / 1.05 - 1))
+            self.assertEqual(set(decisions['reason'][buys]), {'passed'})
+
+    def test_decision_log_tells_sell_reasons_from_buy_reasons(self):
+        with tempfile.TemporaryDirectory() as log_directory:
+            robin_bot = type(self.robin_bot)(**{**offline_config, "decision_log": log_directory,
+                                                "sell_year_threshold": .5}, sandbox=True, broker=get_fake_broker())
+            robin_bot.sell_portfolio()
+            robin_bot.logout()
+            decisions = load_decisions(log_directory, ['reason'])
+            self.assertEqual(set(decisions['reason']), {'below_profit_threshold', 'sell_too_close_to_high'})
+
+    def test_failed_order_does_not_stop_batch(self):
+        broker = get_fake_broker()
+        order_buy = broker.order_buy_crypto_by_price if isinstance(
+            self.robin_bot, RobinCryptoBot) else broker.order_buy_fractional_by_price
+        responses = [None]
+
+        def order_buy_first_unanswered(ticker_symbol, amount):
+            # the first buy gets no response, as a throttled order request does
+            return responses.pop() if responses else order_buy(ticker_symbol, amount)
+        broker.order_buy_fractional_by_price = broker.order_buy_crypto_by_price = order_buy_first_unanswered
+        robin_bot = type(self.robin_bot)(**offline_config, broker=broker)
+        results = robin_bot.buy_from_ticker_list(self.test_symbol_list[:3])
+        self.assertEqual(results[0], "No response to buy order.")
+        self.assertTrue(all(result['state'] == 'filled' for result in results[1:]))
+        self.assertAlmostEqual(robin_bot.ledger.buying_power, broker.buying_power)
+
+    def run_cycles(self, workers):
+        broker = get_fake_broker()
+        broker.holdings.update({'NFLX': [1, 200], 'TSLA': [1, 150]})
+        broker.crypto_holdings.update({'LTC': [1, 50], 'BCH': [1, 100]})
+        robin_bot = type(self.robin_bot)(**{**offline_config, "workers": workers, "sell_limit": 2}, broker=broker)
+        results = [robin_bot.sell_portfolio()]
+        if not isinstance(robin_bot, RobinCryptoBot):
+            results.append(robin_bot.buy_from_top_stocks(buy_limit=2))
+        results.append(robin_bot.buy_from_ticker_list(self.test_symbol_list))
+        return results, (robin_bot.ledger.buying_power, robin_bot.ledger.equity), broker.holdings, \
+            broker.crypto_holdings
+
+    def test_concurrent_cycles_match_sequential(self):
+        # conditions are checked on 8 threads, but limits and the shared budget are applied in order
+        results = self.run_cycles(8)
+        self.assertEqual(results, self.run_cycles(None))
+        self.assertEqual(results[0][0][-1], "Max number of stock sales reached.")
+
+    def get_queueing_broker(self, info_failures=0):
+        # orders are queued when placed and filled by the time their status is requested, which fails
+        # info_failures times first
+        broker = get_fake_broker()
+        for name in ['order_buy_fractional_by_price', 'order_sell_fractional_by_quantity',
+                     'order_buy_crypto_by_price', 'order_sell_crypto_by_quantity']:
+            order = getattr(broker, name)
+            setattr(broker, name, lambda *args, order=order: dict(order(*args), state='queued',
+                                                                   cumulative_quantity='0'))
+        failures = [Exception("Status request failed.")] * info_failures
+        for name in ['get_stock_order_info', 'get_crypto_order_info']:
+            get_order_info = getattr(broker, name)
+
+            def get_order_info_or_fail(order_id, get_order_info=get_order_info):
+                if failures:
+                    raise failures.pop()
+                return get_order_info(order_id)
+            setattr(broker, name, get_order_info_or_fail)
+        return broker
+
+    def test_failed_status_request_does_not_stop_polling(self):
+        broker = self.get_queueing_broker(info_failures=1)
+        robin_bot = type(self.robin_bot)(**{**offline_config, "order_poll_interval": 0}, broker=broker)
+        results = robin_bot.buy_from_ticker_list(self.test_symbol_list[:3])
+        self.assertEqual([result['state'] for result in results], ['queued'] * 3)
+        # the fills are applied once the status request succeeds
+        holdings = broker.crypto_holdings if isinstance(robin_bot, RobinCryptoBot) else broker.holdings
+        for symbol in self.test_symbol_list[:3]:
+            self.assertAlmostEqual(robin_bot.get_shares(symbol), holdings[symbol][0])
+        self.assertAlmostEqual(robin_bot.ledger.buying_power, broker.buying_power)
+
+    def test_orders_outside_batch_are_polled(self):
+        broker = self.get_queueing_broker()
+        robin_bot = type(self.robin_bot)(**{**offline_config, "order_poll_interval": 0}, broker=broker)
+        robin_bot.ledger.load()
+        held = robin_bot.get_shares(self.test_symbol)
+        symbol = self.test_symbol_list[1]
+        robin_bot.buy_with_conditions(symbol)
+        robin_bot.sell(held, self.test_symbol, True)
+        holdings = broker.crypto_holdings if isinstance(robin_bot, RobinCryptoBot) else broker.holdings
+        self.assertAlmostEqual(robin_bot.get_shares(symbol), holdings[symbol][0])
+        self.assertEqual(robin_bot.get_shares(self.test_symbol), 0)
+        self.assertAlmostEqual(robin_bot.ledger.buying_power, broker.buying_power)
+
+    def test_batched_orders_update_cached_state(self):
+        self.robin_bot.sandbox = False
+        self.robin_bot.ledger.load()
+        held = self.robin_bot.get_shares(self.test_symbol)
+        price = self.robin_bot.get_current_price(self.test_symbol)
+        with self.robin_bot.orders.batch():
+            buy_order = self.robin_bot.buy(self.test_symbol, 10)
+            sell_order = self.robin_bot.sell(held / 2, self.test_symbol, True)
+            self.assertEqual(buy_order.state, 'queued')
+            self.assertAlmostEqual(self.robin_bot.ledger.buying_power, 990)
+        self.assertEqual(buy_order.state, 'filled')
+        self.assertEqual(sell_order.state, 'filled')
+        self.assertAlmostEqual(self.robin_bot.get_shares(
+            self.test_symbol), held / 2 + 10 / price)
+        self.assertAlmostEqual(
+            self.robin_bot.ledger.buying_power, 990 + held / 2 * price)
+        # holdings are updated from the fills instead of being fetched again
+        stats = self.robin_bot.instrumentation.dump()
+        self.assertEqual(stats.get('build_holdings', stats.get(
+            'get_crypto_positions'))['calls'], 1)
+
 class TestCryptoRetrievalMethods(TestRetrievalMethods):
 
     def __init__(self, methodName: str = "runTest") -> None:
         super().__init__(methodName)
-        self.robin_bot = RobinCryptoBot(**example_config.config, sandbox=True)
+        self.robin_bot = RobinCryptoBot(
+            **offline_config, sandbox=True, broker=get_fake_broker())
     test_symbol = 'BTC'
     test_symbol_list = example_config.config["crypto_watchlist"]
 
     def test_get_top_n_stocks(self):
-        pass
+        self.skipTest("Top movers are only listed for stocks.")
 
     def test_buy_from_top_stocks(self):
-        pass
+        with self.assertRaises(NotImplementedError):
+            self.robin_bot.buy_from_top_stocks()
+
+    def test_positions_index_uses_one_positions_and_quotes_request(self):
+        equity = self.robin_bot.get_portfolio_equity()
+        self.assertEqual(equity, {'BTC': 300, 'ETH': 950})
+        self.assertEqual(self.robin_bot.get_average_cost('ETH'), 2000)
+        self.assertEqual(self.robin_bot.get_shares('BTC'), .01)
+        stats = self.robin_bot.instrumentation.dump()
+        self.assertEqual(stats['get_crypto_positions']['calls'], 1)
+        self.assertEqual(stats['get_crypto_quotes']['calls'], 1)
 
     def test_buy_from_list(self):
         purchase_results = self.robin_bot.buy_from_ticker_list(
@@ -92,5 +328,339 @@ class TestCryptoRetrievalMethods(TestRetrievalMethods):
         self.assertIsInstance(purchase_results, list)
 
 
+class TestScreening(unittest.TestCase):
+
+    def test_screen_gives_reason_for_each_symbol(self):
+        result = screening.screen(['AAA', 'BBB', 'CCC', 'DDD', 'EEE', 'FFF'],
+                                  [90, 110, 95, 10, 99, float('nan')],
+                                  [100, 100, 100, 100, 100, 100],
+                                  [100, 100, 100, 100, 100, 100],
+                                  ['CCC'], -.05, .3, .95)
+        self.assertEqual(list(result.reasons), [screening.PASSED, screening.NOT_FALLING, screening.IN_PORTFOLIO,
+                                                screening.TOO_FAR_FROM_HIGH, screening.ABOVE_BUY_THRESHOLD,
+                                                screening.MISSING_DATA])
+        self.assertEqual([result.symbols[i] for i in result.ranking], [
+                         'EEE', 'AAA', 'DDD'])
+
+    def test_buy_from_universe(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as universe_file:
+            universe_file.write('# watchlist\nnflx\nTSLA\nAAPL\n')
+        self.addCleanup(os.remove, universe_file.name)
+        robin_bot = RobinBot(**{**offline_config, "universe": universe_file.name}, sandbox=True,
+                             broker=get_fake_broker())
+        results = robin_bot.buy_from_universe(buy_limit=1)
+        self.assertEqual(results, [
+            'Buy NFLX result: Sandbox mode enabled. Simulated buy amount for NFLX is $100.0',
+            'Max number of stock purchases reached (1)'])
+
+
+class TestBarStore(unittest.TestCase):
+
+    def test_day_span_is_last_trading_day(self):
+        # 5 minute bars from 3pm on March 4th to 10am on March 5th 2024, New York time
+        times = np.arange(1709582400, 1709650800, 300)
+        bars = np.array([(bar_time, i, i, i, i) for i, bar_time in enumerate(times)], dtype=BAR_DTYPE)
+        with tempfile.TemporaryDirectory() as bar_directory:
+            bar_store = BarStore(bar_directory)
+            bar_store.append('AAPL', '5minute', bars)
+            # the first bar after midnight, not 24 hours before the last bar
+            self.assertEqual(bar_store.first_price('AAPL', '5minute', 'day', 'close_price'),
+                             float(np.searchsorted(times, 1709614800)))
+
+    def test_append_skips_stored_bars(self):
+        bars = np.array([(bar_time, 1, 1, 1, 1) for bar_time in (300, 600)], dtype=BAR_DTYPE)
+        with tempfile.TemporaryDirectory() as bar_directory:
+            bar_store = BarStore(bar_directory)
+            bar_store.append('AAPL', '5minute', bars[:1])
+            # as another process would, after both read the same last time
+            bar_store.append('AAPL', '5minute', bars)
+            bar_store.append('AAPL', '5minute', bars)
+            self.assertEqual(list(bar_store.get_bars('AAPL', '5minute')['time']), [300, 600])
+
+
+class TestBacktest(unittest.TestCase):
+
+    def get_bars(self, close_prices):
+        dates = [f"2021-01-{day + 1:02d}" for day in range(len(close_prices))]
+        values = np.array([[price, price, price, price]
+                          for price in close_prices], dtype=float)
+        return build_bars(dates, ['AAPL'] * len(dates), values)
+
+    def test_buys_dip_and_sells_at_profit(self):
+        bars = self.get_bars([100, 100, 90, 85, 80, 110, 105])
+        config = {**example_config.config, "span_bars": 2, "year_bars": 3}
+        result = Backtest(bars, initial_cash=1000, **config).run()
+        self.assertEqual([trade.side for trade in result.trades], [
+                         'buy', 'sell'])
+        self.assertGreater(result.summary['profit'], 0)
+        self.assertEqual(len(result.values), 7)
+
+    def test_no_trades_without_signals(self):
+        bars = self.get_bars([100, 101, 102, 103])
+        result = Backtest(bars, initial_cash=1000,
+                          **example_config.config).run()
+        self.assertEqual(result.trades, [])
+        self.assertEqual(result.summary['total_return'], 0)
+
+    def test_sweep_ranks_parameter_sets(self):
+        bars = self.get_bars([100, 100, 90, 85, 80, 110, 105])
+        parameter_sets = parameter_grid(
+            {"profit_threshold": [.1, 5], "buy_threshold": [1]})
+        self.assertEqual(len(parameter_sets), 2)
+        with tempfile.TemporaryDirectory() as bars_directory:
+            save_bars(bars, bars_directory)
+            results = sweep(bars_directory, parameter_sets, {
+                **example_config.config, "span_bars": 2, "year_bars": 3}, processes=1)
+        self.assertEqual(results[0]['parameters']['profit_threshold'], .1)
+        self.assertGreaterEqual(results[0]['score'], results[1]['score'])
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_market_data_calls_do_not_scale_with_symbols(self):
+        for scenario in ['sell_portfolio', 'buy_from_top_stocks', 'buy_from_ticker_list']:
+            result = run_scenario(scenario, 100, 0, None)
+            self.assertLessEqual(result['calls'].get('get_quotes', 0), 2)
+            self.assertLessEqual(result['calls'].get('get_fundamentals', 0), 2)
+            self.assertLessEqual(
+                result['calls'].get('get_stock_historicals', 0), 2)
+            self.assertGreater(result['evaluations'], 0)
+
+
+class TestRobinBotDaemon(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 0
+        self.broker = get_fake_broker()
+        self.broker.clock = lambda: self.now
+        self.bot = RobinBot(**offline_config, sandbox=True,
+                            broker=self.broker)
+        self.daemon = RobinBotDaemon(self.bot, [{"method": "sell_portfolio", "every": 60},
+                                                {"method": "get_top_n_stocks", "every": 120, "kwargs": {"limit": 2}}],
+                                     session_ttl=1000, refresh_margin=100, clock=lambda: self.now)
+
+    def test_runs_cycles_when_due(self):
+        self.assertEqual(set(self.daemon.run_pending()), {
+                         'sell_portfolio', 'get_top_n_stocks'})
+        self.now = 60
+        self.assertEqual(set(self.daemon.run_pending()), {'sell_portfolio'})
+        self.assertEqual(self.daemon.seconds_until_next_run(), 60)
+
+    def test_refreshes_session_only_when_expiring(self):
+        for self.now in range(0, 1000, 60):
+            self.daemon.run_pending()
+        self.assertEqual(
+            self.bot.instrumentation.dump()['login']['calls'], 2)
+        self.assertEqual(self.broker.session_time, 900)
+
+    def test_refreshes_stored_session_by_its_age(self):
+        # a restarted daemon picks up a session stored 850 seconds ago
+        self.broker.session_time = -850
+        self.daemon.run_pending()
+        self.assertEqual(self.broker.session_time, -850)
+        self.now = 60
+        self.daemon.run_pending()
+        self.assertEqual(self.broker.session_time, 60)
+
+    def test_keeps_session_after_failed_cycle(self):
+        self.daemon.run_pending()
+        self.bot.sell_portfolio = lambda: {}['DELISTED']
+        self.now = 60
+        self.daemon.run_pending()
+        self.now = 120
+        self.daemon.run_pending()
+        self.assertEqual(self.broker.session_time, 0)
+
+    def test_renews_session_after_failed_cycle(self):
+        self.daemon.run_pending()
+
+        def sell_portfolio():
+            raise Exception("build_holdings can only be called when logged in")
+        self.bot.sell_portfolio = sell_portfolio
+        self.now = 60
+        self.daemon.run_pending()
+        self.assertEqual(self.broker.session_time, 0)
+        # the next cycle due gets a new session
+        self.now = 120
+        self.daemon.run_pending()
+        self.assertEqual(self.broker.session_time, 120)
+
+
+class TestRobinhoodBroker(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.broker = RobinhoodBroker()
+        self.pairs = [{'id': 'btc-id', 'asset_currency': {'code': 'BTC'}}]
+        self.urls = []
+        self.broker.rs = type("rs", (), {"urls": self.broker.rs.urls, "helper": self})
+
+    def request_get(self, url, data_type='regular', payload=None):
+        self.urls.append(url)
+        if url == self.broker.rs.urls.crypto_currency_pairs_url():
+            # the first lookup fails
+            return [None] if len(self.urls) == 1 else self.pairs
+        return [{'id': pair_id, 'mark_price': '30000'} for pair_id in payload['ids'].split(',')]
+
+    def test_crypto_pairs_are_looked_up_again(self):
+        self.assertIsNone(self.broker.get_crypto_quotes(['BTC']))
+        self.assertEqual(self.broker.get_crypto_quotes(['BTC']),
+                         [{'id': 'btc-id', 'mark_price': '30000', 'symbol': 'BTC'}])
+        # coins added later are looked up too
+        self.pairs.append({'id': 'eth-id', 'asset_currency': {'code': 'ETH'}})
+        self.assertEqual([quote['symbol'] for quote in self.broker.get_crypto_quotes(['BTC', 'ETH'])],
+                         ['BTC', 'ETH'])
+        self.assertEqual(self.urls[-1], 'https://api.robinhood.com/marketdata/forex/quotes/')
+
+
+class TestCassette(unittest.TestCase):
+
+    def run_cycle(self, broker=None, **kwargs):
+        robin_bot = RobinBot(**{**offline_config, **kwargs}, broker=broker)
+        results = robin_bot.sell_portfolio() + \
+            robin_bot.buy_from_top_stocks(buy_limit=5)
+        robin_bot.logout()
+        return results
+
+    def test_replays_recorded_cycle(self):
+        with tempfile.TemporaryDirectory() as cassette_directory:
+            path = os.path.join(cassette_directory, "cycle.json.gz")
+            recorded = self.run_cycle(
+                broker=get_fake_broker(), record_to=path)
+            self.assertEqual(self.run_cycle(replay_from=path), recorded)
+            replay_bot = RobinBot(**{**offline_config, "replay_from": path})
+            with self.assertRaises(Exception):
+                replay_bot.fetch_prices(['NFLX', 'TSLA', 'AMZN'])
+
+
+class TestSupervisor(unittest.TestCase):
+
+    def test_workers_share_market_data(self):
+        accounts = [{"name": "stocks", "sandbox": True},
+                    {"name": "other_stocks", "sandbox": True},
+                    {"name": "more_stocks", "sandbox": True,
+                        "config": {"span": "month"}},
+                    {"name": "crypto", "crypto": True, "sandbox": True}]
+        supervisor = Supervisor(accounts, offline_config, get_account_broker)
+        supervisor.start()
+        try:
+            results = supervisor.run_cycle([{"method": "sell_portfolio"},
+                                            {"method": "buy_from_top_stocks", "kwargs": {"buy_limit": 5}}])
+        finally:
+            supervisor.stop()
+        self.assertEqual(set(results), {"stocks", "other_stocks", "more_stocks", "crypto"})
+        # the first stock account's worker fetches the shared market data with its own session
+        self.assertIn('get_top_100', results["stocks"][1])
+        cycle_results, stats = results["other_stocks"]
+        self.assertIsInstance(cycle_results["buy_from_top_stocks"], list)
+        for method_name in ['get_top_100', 'get_quotes', 'get_fundamentals', 'get_stock_historicals']:
+            self.assertNotIn(method_name, stats)
+        # a different span needs its own first prices
+        self.assertIn('get_stock_historicals', results["more_stocks"][1])
+        self.assertIn('Failed', results["crypto"][0]["buy_from_top_stocks"])
+
+    def test_reports_dead_workers_as_failed(self):
+        accounts = [{"name": "dies", "sandbox": True, "exit_code": 3},
+                    {"name": "stocks", "sandbox": True}]
+        supervisor = Supervisor(accounts, offline_config, get_account_broker, check_interval=.1)
+        supervisor.start()
+        try:
+            results = supervisor.run_cycle([{"method": "sell_portfolio"}])
+        finally:
+            supervisor.stop()
+        self.assertEqual(results["dies"], ({"sell_portfolio": "Worker exited with code 3."}, {}))
+        self.assertIsInstance(results["stocks"][0]["sell_portfolio"], list)
+        self.assertEqual(supervisor.workers, {})
+
+    def test_drops_late_results(self):
+        accounts = [{"name": "stocks", "sandbox": True},
+                    {"name": "slow", "sandbox": True, "delay": 3}]
+        supervisor = Supervisor(accounts, offline_config, get_account_broker, cycle_timeout=2, check_interval=.1)
+        supervisor.start()
+        try:
+            timed_out = supervisor.run_cycle([{"method": "sell_portfolio"}])
+            results = supervisor.run_cycle([{"method": "get_top_n_stocks", "kwargs": {"limit": 2}}])
+        finally:
+            supervisor.stop()
+        self.assertEqual(timed_out["slow"], ({"sell_portfolio": "Worker timed out after 2 seconds."}, {}))
+        # the slow worker's answer to the first cycle isn't taken as its answer to the second
+        self.assertEqual(results["slow"][0], results["stocks"][0])
+        self.assertEqual(list(results["slow"][0]), ["get_top_n_stocks"])
+
+
+class TestCli(unittest.TestCase):
+
+    def test_runs_command_from_config_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cassette_path = os.path.join(directory, "cycle.json.gz")
+            robin_bot = RobinBot(**{**offline_config, "record_to": cassette_path},
+                                 sandbox=True, broker=get_fake_broker())
+            expected = robin_bot.sell_portfolio()
+            robin_bot.logout()
+            config_path = os.path.join(directory, "config.json")
+            with open(config_path, "w") as config_file:
+                json.dump({**offline_config, "replay_from": cassette_path}, config_file)
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                cli.main(["--config", config_path, "--sandbox", "sell"])
+            self.assertEqual(output.getvalue().splitlines(), expected)
+
+
+class TestCryptoMonitor(unittest.TestCase):
+
+    def test_rolling_window_tracks_first_and_high(self):
+        window = RollingWindow(span=3, interval=1)
+        for sample_time, price in enumerate([5, 9, 7, 6, 4]):
+            window.add(sample_time, price)
+        self.assertEqual((window.first(), window.high()), (9, 9))
+        window.add(5, 3)
+        self.assertEqual((window.first(), window.high()), (7, 7))
+        # a price within the last sample's interval only counts towards the high
+        window.add(5.5, 8)
+        self.assertEqual((window.first(), window.high()), (7, 8))
+        self.assertEqual(len(window.samples), 4)
+
+    def test_acts_only_when_conditions_start_being_met(self):
+        broker = get_fake_broker()
+        robin_bot = RobinCryptoBot(**{**offline_config, "buy_threshold": -.1},
+                                   sandbox=True, broker=broker)
+        monitor = CryptoMonitor(robin_bot, sleep=lambda seconds: None)
+        self.assertEqual(monitor.tick(), [
+            f"Sell BTC result: Sandbox mode enabled. Simulated sell amount for BTC is ${robin_bot.get_shares('BTC')}"])
+        historicals_calls = robin_bot.instrumentation.dump()['get_crypto_historicals']['calls']
+        self.assertEqual(monitor.tick(), [])
+        broker.quotes['DOGE'] = .06
+        results = monitor.tick()
+        self.assertEqual(len(results), 1)
+        self.assertTrue(results[0].startswith("Buy DOGE result: Sandbox mode enabled."))
+        stats = robin_bot.instrumentation.dump()
+        self.assertEqual(stats['get_crypto_historicals']['calls'], historicals_calls)
+        self.assertLessEqual(stats['get_crypto_quotes']['calls'], 4)
+
+
+class TestRequestScheduler(unittest.TestCase):
+
+    def test_retries_throttled_requests(self):
+        delays = []
+        responses = [{'detail': 'Request was throttled. Expected available in 3 seconds.'}, [{'symbol': 'AAPL'}]]
+        scheduler = RequestScheduler(sleep=delays.append)
+        result = scheduler.call(lambda: responses.pop(0), retry_empty=True)
+        self.assertEqual(result, [{'symbol': 'AAPL'}])
+        self.assertEqual(delays, [3.0])
+
+    def test_does_not_retry_orders_on_empty_response(self):
+        calls = []
+        scheduler = RequestScheduler(sleep=lambda delay: None)
+        result = scheduler.call(lambda: calls.append(1), priority=ORDER_PRIORITY)
+        self.assertIsNone(result)
+        self.assertEqual(len(calls), 1)
+
+    def test_limits_request_rate(self):
+        scheduler = RequestScheduler(rate=50, burst=1)
+        start = time.monotonic()
+        for _ in range(6):
+            scheduler.call(lambda: None)
+        self.assertGreaterEqual(time.monotonic() - start, .09)
+
+
 if __name__ == '__main__':
     unittest.main()